@@ -0,0 +1,250 @@
+# Author: Albert de Jamblinne de Meux
+# thealbertsmail@gmail.com
+# All right reserved.
+#
+# Under Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International Public License
+# Read the LICENSE.TXT for detail or https://creativecommons.org/licenses/by-nc-sa/4.0/legalcode
+
+
+# Resumable extraction of a large set of documents:
+#
+#   python -m Issuer_extraction.batch extractor.model --folder ../Newdata/train/ \
+#          --output issuer.jsonl --csv issuer.csv
+#
+# The input is a jsonl file (--input, - for stdin) with one line per isin:
+#   {"isin": "XS0000000001", "paths": ["txt/123_a.txt", "html/123_a.html"]}
+# or the documents of a data folder (--folder, see label_data.data). The paths of an isin are
+# tried in order until a value is found, or with --min-score (and --min-margin) until a value is
+# confident enough (see NEModel.extractor.cascade). The .html/.htm files are converted by the
+# fast path of txt_processing.get_text.
+#
+# The output (jsonl) has one line per isin:
+#   {"isin": ..., "value": ..., "score": ..., "margin": ..., "path": ..., "read": number of files read}
+# (value null if nothing is found). It is written as the isins are done and is the checkpoint:
+# a new run with the same output skips the isins already in it. --csv writes all the results in
+# the format of label_data.to_csv at the end (for label_data.merge_csv).
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+
+import NEModel
+import label_data
+import txt_processing
+
+# extractor and token cache of a worker process
+_worker = None
+
+
+def folder_records(folder, index=None):
+    '''
+    Records of the documents of a data folder: for each isin of label_data.data, the txt files
+    of its documents, then their html files (as in the example).
+
+    Args:
+        folder: the data folder.
+        index: if True, the lists of the txt and html files are kept in txt.index and
+            html.index in the data folder (see txt_processing.get_files).
+
+    Return: iterator of {"isin": ..., "paths": [...]}
+    '''
+    d = label_data.data(folder=folder)
+    filesTxT = txt_processing.get_files(os.path.join(folder, 'txt'), index=index)
+    filesHtml = txt_processing.get_files(os.path.join(folder, 'html'), index=index)
+    for isin in d.docid:
+        paths = []
+        for item in d.docid[isin]:
+            for files in (filesTxT, filesHtml):
+                if item in files:
+                    paths.append(files[item])
+        yield {'isin': isin, 'paths': paths}
+
+
+def read_records(fileobj):
+    '''
+    Records of a jsonl file (the empty lines are ignored).
+    '''
+    for line in fileobj:
+        if line.strip():
+            yield json.loads(line)
+
+
+def done_records(filename):
+    '''
+    isins already in an output file. A last line cut by a crash is removed from the file.
+    '''
+    done = set()
+    if not os.path.isfile(filename):
+        return done
+
+    valid = 0 # end of the last complete line
+    with open(filename, 'rb') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                break
+            try:
+                done.add(json.loads(line)['isin'])
+            except (ValueError, KeyError):
+                break
+            valid += len(line)
+    if valid < os.path.getsize(filename):
+        with open(filename, 'r+b') as f:
+            f.truncate(valid)
+    return done
+
+
+def _read(path, cache):
+    '''
+    Text (or clean words, see NEModel.tokencache) of a file.
+    '''
+    html = path.lower().endswith(('.html', '.htm'))
+    if cache is None:
+        return txt_processing.get_text(path, raw=not html, fast=True)
+    if html:
+        return cache.words(txt_processing.get_text(path, raw=False, fast=True))
+    return cache.read(path)
+
+
+def _unicode(value):
+    '''
+    A byte string decoded for json (utf-8, or latin-1 for the values of the older files).
+    '''
+    if not isinstance(value, str):
+        return value
+    try:
+        return value.decode('utf-8')
+    except UnicodeDecodeError:
+        return value.decode('latin-1')
+
+
+def extract_record(extract, record, cache=None, minScore=None, minMargin=0.0):
+    '''
+    Extract the value of a record from its paths, see NEModel.extractor.cascade (the missing
+    files are skipped).
+
+    Return: result line (dict).
+    '''
+    read = [] # paths of the texts given to the extractor
+
+    def texts():
+        for path in record.get('paths', []):
+            try:
+                txt = _read(path, cache)
+            except (IOError, OSError, AssertionError): # missing file
+                continue
+            read.append(path)
+            yield txt
+
+    value, score, margin, x = extract.cascade(texts(), minScore, minMargin)
+    return {'isin': _unicode(record['isin']), 'value': _unicode(value), 'score': score, 'margin': margin,
+            'path': _unicode(read[x]) if x is not None else None, 'read': len(read)}
+
+
+def _init_worker(extract, cache, minScore, minMargin):
+    global _worker
+    _worker = (extract, cache, minScore, minMargin)
+
+
+def _extract_worker(record):
+    return extract_record(_worker[0], record, *_worker[1:])
+
+
+def run(extract, records, output, workers=None, cache=None, minScore=None, minMargin=0.0, fsync=1000):
+    '''
+    Extract the records not already in output and append their results to it.
+
+    Args:
+        extract: the extractor.
+        records: iterable of records (see read_records).
+        output: path of the output file (jsonl).
+        workers: number of processes, by default the number of cpu.
+        cache: a NEModel.tokencache or None.
+        minScore, minMargin: confidence needed to stop (see NEModel.extractor.cascade).
+        fsync: the output is written on disk every fsync results.
+
+    Return: number of records done in this run.
+    '''
+    done = done_records(output)
+    todo = (record for record in records if record['isin'] not in done)
+    if workers is None:
+        workers = multiprocessing.cpu_count()
+
+    pool = None
+    if workers > 1:
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(extract, cache, minScore, minMargin))
+        results = pool.imap_unordered(_extract_worker, todo, chunksize=4)
+    else:
+        results = (extract_record(extract, record, cache, minScore, minMargin) for record in todo)
+
+    n = 0
+    try:
+        with open(output, 'ab') as f:
+            for result in results:
+                f.write(json.dumps(result) + '\n')
+                f.flush()
+                n += 1
+                if n % fsync == 0:
+                    os.fsync(f.fileno())
+            f.flush()
+            os.fsync(f.fileno())
+    finally:
+        if pool is not None:
+            pool.terminate()
+    return n
+
+
+def to_csv(output, filename):
+    '''
+    Write the results of an output file in a csv file (see label_data.to_csv), an empty string
+    for the isins without value. The csv is encoded in utf-8.
+    '''
+    data = dict()
+    with open(output, 'rb') as f:
+        for record in read_records(f):
+            value = record['value'] if record['value'] is not None else u''
+            data[record['isin'].encode('utf-8')] = value.encode('utf-8')
+    label_data.to_csv(filename, data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Resumable extraction of a set of documents.')
+    parser.add_argument('model', help='saved extractor (see NEModel.extractor.save)')
+    parser.add_argument('--input', help='jsonl file of the records, - for stdin')
+    parser.add_argument('--folder', help='data folder (see label_data.data), instead of --input')
+    parser.add_argument('--index', action='store_true',
+                        help='with --folder, keep the lists of the files in an index (see txt_processing.get_files)')
+    parser.add_argument('--output', required=True, help='jsonl file of the results (and checkpoint)')
+    parser.add_argument('--csv', help='write all the results in this csv file at the end')
+    parser.add_argument('--workers', type=int, default=None, help='number of processes')
+    parser.add_argument('--cache', help='folder of the cache of the clean texts (see NEModel.tokencache)')
+    parser.add_argument('--min-score', type=float, default=None,
+                        help='read the next files of an isin until a value has this score')
+    parser.add_argument('--min-margin', type=float, default=0.0,
+                        help='and this margin over the best other value (with --min-score)')
+    args = parser.parse_args(argv)
+    if (args.input is None) == (args.folder is None):
+        parser.error('one of --input or --folder is needed')
+
+    extract = NEModel.extractor.from_file(args.model)
+    cache = None
+    if args.cache is not None:
+        cache = NEModel.tokencache(args.cache, extract.matcher)
+
+    options = (args.workers, cache, args.min_score, args.min_margin)
+    if args.folder is not None:
+        n = run(extract, folder_records(args.folder, args.index), args.output, *options)
+    elif args.input == '-':
+        n = run(extract, read_records(sys.stdin), args.output, *options)
+    else:
+        with open(args.input, 'rb') as f:
+            n = run(extract, read_records(f), args.output, *options)
+    print '%d records done' % n
+
+    if args.csv is not None:
+        to_csv(args.output, args.csv)
+
+
+if __name__ == '__main__':
+    main()
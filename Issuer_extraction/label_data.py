@@ -11,6 +11,7 @@
 import os
 import ordered_set
 import csv
+import numpy as np
 
 
 def merge_csv(files=('issuer.csv', 'guarantor.csv', 'roc.csv', 'zcp.csv', 'minTrad.csv', 'mltTrad.csv', 'optCur.csv'),
@@ -60,19 +61,96 @@ def to_csv(filename, data):
         for item in data:
             writer.writerow([item,data[item]])
 
+class column(object):
+    '''
+    Read only dict isin -> tuple of strings (without duplicates, in the order of the file),
+    stored in arrays: the isin number x (in isins, shared between the columns) has the values
+    strings[codes[offsets[x]:offsets[x + 1]]] if present[x]. The strings are stored only once.
+    '''
+
+    def __init__(self, isins, rows):
+        '''
+        Args:
+            isins: intern table of the isin (see data), updated.
+            rows: iterable of (isin, value), a value None remove the previous values of the isin.
+        '''
+        self.isins = isins
+        strings = dict()
+        values = dict() # isin number -> list of string numbers
+        for isin, value in rows:
+            x = isins.setdefault(isin, len(isins))
+            if value is None:
+                values[x] = []
+            else:
+                v = strings.setdefault(value, len(strings))
+                codes = values.setdefault(x, [])
+                if v not in codes:
+                    codes.append(v)
+
+        self.strings = [None] * len(strings)
+        for value, v in strings.iteritems():
+            self.strings[v] = value
+        n = max(values.keys() + [-1]) + 1
+        self.present = np.zeros(n, dtype=bool)
+        self.present[values.keys()] = True
+        counts = np.zeros(n, dtype=np.int64)
+        for x in values:
+            counts[x] = len(values[x])
+        self.offsets = np.zeros(n + 1, dtype=np.int64)
+        self.offsets[1:] = np.cumsum(counts)
+        self.codes = np.zeros(self.offsets[-1], dtype=np.int32)
+        for x in values:
+            self.codes[self.offsets[x]:self.offsets[x + 1]] = values[x]
+        self.removed = set() # isin numbers hidden (see data.torm)
+
+    def _index(self, isin):
+        x = self.isins.get(isin, -1)
+        if 0 <= x < len(self.present) and self.present[x] and x not in self.removed:
+            return x
+        return -1
+
+    def __contains__(self, isin):
+        return self._index(isin) >= 0
+
+    def __getitem__(self, isin):
+        x = self._index(isin)
+        if x < 0:
+            raise KeyError(isin)
+        return tuple(self.strings[v] for v in self.codes[self.offsets[x]:self.offsets[x + 1]])
+
+    def get(self, isin, default=None):
+        if isin in self:
+            return self[isin]
+        return default
+
+    def __iter__(self):
+        return (isin for isin, x in self.isins.iteritems()
+                if x < len(self.present) and self.present[x] and x not in self.removed)
+
+    def keys(self):
+        return list(self)
+
+    def items(self):
+        return [(isin, self[isin]) for isin in self]
+
+    def __len__(self):
+        return int(self.present.sum()) - len(self.removed)
+
+
 class data(object):
     '''
     Store the data from the data set, this is the labels if available and the
     filesId (always).
 
+    The files are read when their data are used for the first time.
     '''
     def __init__(self,folder='../Newdata/train/',):
         '''
         Create a new data class with the data imported.
 
-        the data store in the object are store under the form of a dict.
-        For each dict, the isin are the key and the values are orderedSet containing strings
-        with the data. The set is empty if there are no label
+        the data store in the object are store under the form of a dict like column.
+        For each column, the isin are the key and the values are tuples containing strings
+        with the data. The tuple is empty if there are no label
 
         self.docid : document ids.
         self.guarantor : names of the guarantor
@@ -82,6 +160,7 @@ class data(object):
         self.mltTrad : Min trade amount
         self.optCur : operational currency
         self.roc : required open cities.
+        self.torm : isin without all the labels (removed from docid).
 
         Args:
             folder: path to the root folder where the data are, the exact path for the
@@ -90,128 +169,91 @@ class data(object):
         '''
         type = folder.strip('/').split('/')[-1]
         if type == 'train':
-            docidf = os.path.join(folder,'docID/docid_train.csv')
-            guarantorf = os.path.join(folder,'outcome/guarantor_train.csv')
-            isinf = os.path.join(folder,'outcome/ISIN_train.csv')
-            rocf = os.path.join(folder,'outcome/ROC_train.csv')
+            self.docidf = os.path.join(folder,'docID/docid_train.csv')
+            self.guarantorf = os.path.join(folder,'outcome/guarantor_train.csv')
+            self.isinf = os.path.join(folder,'outcome/ISIN_train.csv')
+            self.rocf = os.path.join(folder,'outcome/ROC_train.csv')
         elif type == 'int_test':
-            docidf = os.path.join(folder,'docID/docid_int_test.csv')
-            guarantorf = None
-            isinf= None
-            rocf = None
+            self.docidf = os.path.join(folder,'docID/docid_int_test.csv')
+            self.guarantorf = None
+            self.isinf= None
+            self.rocf = None
         elif type == 'final_test':
-            docidf = os.path.join(folder,'docID/docid_final_test.csv')
-            guarantorf = None
-            isinf= None
-            rocf = None
+            self.docidf = os.path.join(folder,'docID/docid_final_test.csv')
+            self.guarantorf = None
+            self.isinf= None
+            self.rocf = None
 
         else:
             raise ValueError('Only train and int_test folder can be use.')
 
-        self.docid = {}
-        self.guarantor = {}
-        self.issuer = {}
-        self.zcp = {} # zero coupon flag
-        self.minTrad = {}
-        self.mltTrad = {}
-        self.optCur = {}
-        self.roc = {}
-
-        with open(docidf) as f:
-            f=csv.reader(f)
-            #line = f.next()
+        self.isins = dict() # isin -> number, shared by all the columns
+        self._columns = dict()
+
+    def _rows(self, filename, key, value, keepEmpty=True):
+        '''
+        Read the rows (isin, value) of a csv file (without its header).
+
+        Args:
+            key, value: columns of the isin and of the value.
+            keepEmpty: if False an empty value remove the previous values of the isin (None).
+        '''
+        if filename is None:
+            return
+        with open(filename) as f:
+            f = csv.reader(f)
             next(f)
             for tmp in f:
-                if tmp[1] in self.docid:
-                    self.docid[tmp[1]].add(tmp[0])
+                if tmp[value] == '' and not keepEmpty:
+                    yield tmp[key], None
                 else:
-                    self.docid[tmp[1]]=ordered_set.OrderedSet((tmp[0],))
-
-        if guarantorf is not None:
-            with open(guarantorf) as f:
-                f = csv.reader(f)
-                #line = f.next()
-                next(f)
-                for tmp in f:
-                    if tmp[1] != '':
-                        if tmp[0] in self.guarantor:
-                            self.guarantor[tmp[0]].add(tmp[1])
-                        else:
-                            self.guarantor[tmp[0]]=ordered_set.OrderedSet((tmp[1],))
-                    else:
-                        self.guarantor[tmp[0]] = ordered_set.OrderedSet()
-
-        if rocf is not None:
-            with open(rocf) as f:
-                f = csv.reader(f)
-                #line = f.next()
-                next(f)
-                for tmp in f:
-                    if tmp[1] != '':
-                        if tmp[0] in self.roc:
-                            self.roc[tmp[0]].add(tmp[1])
-                        else:
-                            self.roc[tmp[0]]=ordered_set.OrderedSet((tmp[1],))
-                    else:
-                        self.roc[tmp[0]] = ordered_set.OrderedSet()
-
-        if isinf is not None:
-            with open(isinf) as f:
-                f = csv.reader(f)
-                #line = f.next()
-                next(f)
-                for tmp in f:
-                    if tmp[0] in self.issuer:
-                        self.issuer[tmp[0]].add(tmp[1])
-                    else:
-                        self.issuer[tmp[0]]=ordered_set.OrderedSet((tmp[1],))
-
-                    if tmp[0] in self.zcp:
-                        self.zcp[tmp[0]].add(tmp[2])
-                    else:
-                        self.zcp[tmp[0]] = ordered_set.OrderedSet((tmp[2],))
-
-                    if tmp[0] in self.minTrad:
-                        self.minTrad[tmp[0]].add(tmp[3])
-                    else:
-                        self.minTrad[tmp[0]] = ordered_set.OrderedSet((tmp[3],))
-
-                    if tmp[0] in self.mltTrad:
-                        self.mltTrad[tmp[0]].add(tmp[4])
-                    else:
-                        self.mltTrad[tmp[0]] = ordered_set.OrderedSet((tmp[4],))
-
-                    if tmp[0] in self.optCur:
-                        self.optCur[tmp[0]].add(tmp[5])
-                    else:
-                        self.optCur[tmp[0]] = ordered_set.OrderedSet((tmp[5],))
-
-        self.torm=set()
-        if guarantorf is not None:
-            for isin in self.docid:
-                if isin not in self.guarantor:
-                    self.torm.add(isin)
-
-                if isin not in self.issuer:
-                    self.torm.add(isin)
-
-                if isin not in self.zcp:
-                    self.torm.add(isin)
-
-                if isin not in self.minTrad:
-                    self.torm.add(isin)
-
-                if isin not in self.mltTrad:
-                    self.torm.add(isin)
-
-                if isin not in self.optCur:
-                    self.torm.add(isin)
-
-                if isin not in self.roc:
-                    self.torm.add(isin)
-
-        for item in self.torm:
-            del self.docid[item]
+                    yield tmp[key], tmp[value]
+
+    def _column(self, name):
+        '''
+        Load (once) a column.
+        '''
+        if name not in self._columns:
+            if name == 'docid':
+                self._columns[name] = column(self.isins, self._rows(self.docidf, 1, 0))
+                self._columns[name].removed = set(self.isins[isin] for isin in self.torm)
+            elif name in ('guarantor', 'roc'):
+                filename = getattr(self, name + 'f')
+                self._columns[name] = column(self.isins, self._rows(filename, 0, 1, keepEmpty=False))
+            else: # all in the isin file.
+                self._columns[name] = column(self.isins, self._rows(self.isinf, 0, self._isinColumns[name]))
+        return self._columns[name]
+
+    # columns of the isin file
+    _isinColumns = {'issuer': 1, 'zcp': 2, 'minTrad': 3, 'mltTrad': 4, 'optCur': 5}
+
+    docid = property(lambda self: self._column('docid'))
+    guarantor = property(lambda self: self._column('guarantor'))
+    issuer = property(lambda self: self._column('issuer'))
+    zcp = property(lambda self: self._column('zcp'))
+    minTrad = property(lambda self: self._column('minTrad'))
+    mltTrad = property(lambda self: self._column('mltTrad'))
+    optCur = property(lambda self: self._column('optCur'))
+    roc = property(lambda self: self._column('roc'))
+
+    @property
+    def torm(self):
+        '''
+        isin of docid without all the labels (for the training set only).
+        '''
+        if '_torm' in self.__dict__:
+            return self._torm
+
+        if self.guarantorf is None:
+            self._torm = set()
+        elif 'docid' not in self._columns:
+            self._column('docid') # compute self._torm
+        else:
+            labels = [self._column(name) for name in ('guarantor', 'issuer', 'zcp', 'minTrad',
+                                                      'mltTrad', 'optCur', 'roc')]
+            self._torm = set(isin for isin in self._columns['docid']
+                             if any(isin not in item for item in labels))
+        return self._torm
 
 
 def test(prediction, answer):
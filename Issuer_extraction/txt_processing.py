@@ -9,32 +9,90 @@
 # function to process the txt.
 
 import os
+import io
+import mmap
 import html2text
 import re
+import HTMLParser
+import htmlentitydefs
+import json
+import tempfile
+try:
+    from os import scandir
+except ImportError: # python 2, the backport if it is installed.
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
-def get_files(folder):
+def get_files(folder, index=None):
     """
     Provide a dict with the files.
     the key of the dict are the fileid,
     the values are the path to the file.
+
+    With an index, the dict is saved in an index file which is reused (by all the runs and
+    processes) as long as the folder does not change. Only the modification time of the folder is
+    checked: it changes when a file is added, removed or renamed, not when a file is rewritten in
+    place (the index only holds names and paths, so this is enough as long as the names of the
+    files do not change without a rename). The index file is written next to the folder by
+    default, which needs a writable parent folder (if it cannot be written, it is not saved).
+
+    Args:
+        folder: folder of the files.
+        index: None (default) for no index, True for an index next to the folder
+            (folder + '.index'), or the path of the index file.
     """
-    filelist = os.listdir(folder)
+    if index is True:
+        index = os.path.realpath(folder) + '.index'
+    mtime = os.stat(folder).st_mtime
+
+    if index:
+        try:
+            with open(index, 'rb') as f:
+                saved = json.load(f)
+            if saved['folder'] == os.path.realpath(folder) and saved['mtime'] == mtime:
+                return dict((key.encode('utf-8'), path.encode('utf-8'))
+                            for key, path in saved['files'].iteritems())
+        except (IOError, ValueError, KeyError): # no index or damaged.
+            pass
+
     files = {}
-    for f in filelist:
+    for f in _listdir(folder):
         tmp=f.split('_')[0]
         if '.txt' in tmp:
             tmp=tmp.replace('.txt','')
         files[tmp] = os.path.realpath(os.path.join(folder,f))
 
+    if index:
+        # written in an other file and renamed, the other processes read the old or new index.
+        try:
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(index), suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                json.dump({'folder': os.path.realpath(folder), 'mtime': mtime, 'files': files}, f)
+            os.rename(tmp, index)
+        except (IOError, OSError, ValueError): # read only (or name not in utf-8), not saved.
+            pass
+
     return files
 
-def get_text(filename, raw=True):
+def _listdir(folder):
+    """
+    Names of the entries of a folder, with scandir when available (faster on large folders).
+    """
+    if scandir is None:
+        return os.listdir(folder)
+    return [entry.name for entry in scandir(folder)]
+
+def get_text(filename, raw=True, fast=False):
     '''
     Return the text from a file.
 
     Args:
         filename: file to read
         raw: if False, the html tags are strip.
+        fast: if True the html is converted by html_to_text and cleaned by clean_text (the same
+            words as html2text followed by clean_text, much faster), else by html2text.
 
     Return: a string with the text.
     '''
@@ -47,8 +105,26 @@ def get_text(filename, raw=True):
     else:
         with open(filename, 'r') as f:
             data = f.read().decode('ascii', errors='ignore')
+        if fast:
+            return clean_text(html_to_text(data))
         return html2text.html2text(pre_html(data))
 
+def open_text(filename):
+    '''
+    Open a file as a read only memory map, to be read by chunks (see NEModel.extractor.extract_stream).
+
+    Args:
+        filename: file to read
+
+    Return: a mmap (or an empty file object for an empty file).
+    '''
+    assert os.path.isfile(filename)
+
+    with open(filename, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0: # empty files can not be mapped.
+            return io.BytesIO()
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
 def pre_html(text):
     """
     Play with html tags before we strip all the html tags.
@@ -58,15 +134,167 @@ def pre_html(text):
 
     return text
 
+class htmltext(HTMLParser.HTMLParser):
+    """
+    Streaming html to text conversion, a fast replacement of pre_html followed by html2text
+    which keeps only the structure we use: the text of the page, a line break after each block,
+    a point at the end of the rows and paragraphs (as pre_html) and '| ' between the cells
+    of a row (as html2text). The scripts and styles are dropped.
+
+    The html is given by pieces with feed (and close at the end), the text is taken with read.
+    """
+
+    # tags followed by a line break.
+    blocks = set(['p', 'div', 'br', 'tr', 'table', 'li', 'ul', 'ol', 'dl', 'dt', 'dd', 'h1', 'h2',
+                  'h3', 'h4', 'h5', 'h6', 'blockquote', 'pre', 'hr', 'section', 'article', 'header',
+                  'footer', 'center', 'form', 'caption'])
+    # tags whose content is dropped.
+    hidden = set(['script', 'style', 'title'])
+    # entities replaced by ascii characters, the accents are removed as html2text does (the others
+    # are converted to unicode).
+    entities = {'nbsp': ' ', 'amp': '&', 'lt': '<', 'gt': '>', 'quot': '"', 'apos': "'",
+                'aacute': 'a', 'acirc': 'a', 'aelig': 'ae', 'agrave': 'a', 'aring': 'a', 'atilde': 'a',
+                'auml': 'a', 'copy': '(C)', 'eacute': 'e', 'ecirc': 'e', 'egrave': 'e', 'euml': 'e',
+                'iacute': 'i', 'icirc': 'i', 'igrave': 'i', 'iuml': 'i', 'larr': '<-', 'ldquo': '"',
+                'lrm': '', 'lsquo': "'", 'mdash': '--', 'middot': '*', 'ndash': '-', 'oacute': 'o',
+                'ocirc': 'o', 'oelig': 'oe', 'ograve': 'o', 'otilde': 'o', 'ouml': 'o', 'rarr': '->',
+                'rdquo': '"', 'rlm': '', 'rsquo': "'", 'uacute': 'u', 'ucirc': 'u', 'ugrave': 'u',
+                'uuml': 'u'}
+
+    def __init__(self):
+        HTMLParser.HTMLParser.__init__(self)
+        self.parts = []
+        self.hide = 0 # number of open hidden tags.
+        self.cells = 0 # number of cells in the current row.
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.hidden:
+            self.hide += 1
+        elif tag in ('td', 'th'):
+            if self.cells > 0:
+                self.parts.append('| ')
+            self.cells += 1
+        elif tag == 'tr':
+            self.cells = 0
+        elif tag in self.blocks:
+            self.parts.append('\n')
+
+    def handle_startendtag(self, tag, attrs):
+        if tag in self.blocks:
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in self.hidden:
+            self.hide = max(self.hide - 1, 0)
+        elif tag in ('p', 'tr'):
+            self.parts.append('.\n')
+        elif tag in ('td', 'th'):
+            self.parts.append(' ')
+        elif tag in self.blocks:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if self.hide == 0:
+            self.parts.append(data)
+
+    def handle_entityref(self, name):
+        if name in self.entities:
+            self.handle_data(self.entities[name])
+        elif name in htmlentitydefs.name2codepoint:
+            self.handle_data(unichr(htmlentitydefs.name2codepoint[name]))
+        else:
+            self.handle_data('&' + name)
+
+    def handle_charref(self, name):
+        try:
+            if name[0] in 'xX':
+                c = int(name[1:], 16)
+            else:
+                c = int(name)
+            name = htmlentitydefs.codepoint2name.get(c)
+            self.handle_data(self.entities[name] if name in self.entities else unichr(c))
+        except (ValueError, OverflowError):
+            self.handle_data('&#' + name)
+
+    def read(self):
+        """
+        Return the text converted since the last call.
+        """
+        result = ''.join(self.parts)
+        self.parts = []
+        return result
+
+def html_to_text(data):
+    """
+    Convert a html page into text (see htmltext).
+    """
+    parser = htmltext()
+    parser.feed(data)
+    parser.close()
+    return parser.read()
+
+class htmlfile(object):
+    """
+    File like object giving the text of a html file object read by chunks (see htmltext), for
+    NEModel.extractor.extract_stream. The chunks read as str are decoded as ascii (like get_text).
+    """
+
+    def __init__(self, fileobj, chunk=1048576):
+        self.fileobj = fileobj
+        self.chunk = chunk
+        self.parser = htmltext()
+        self.buffer = ''
+        self.eof = False
+
+    def read(self, size=-1):
+        while not self.eof and (size < 0 or len(self.buffer) < size):
+            data = self.fileobj.read(self.chunk)
+            if len(data) == 0:
+                self.parser.close()
+                self.eof = True
+            else:
+                if isinstance(data, str):
+                    data = data.decode('ascii', errors='ignore')
+                self.parser.feed(data)
+            self.buffer += self.parser.read()
+
+        if size < 0:
+            size = len(self.buffer)
+        result, self.buffer = self.buffer[:size], self.buffer[size:]
+        return result
+
+# separators (runs of spaces, points, |, : and -) changed by clean_text, the others are only spaces.
+_cleanRun = re.compile(r'[ \x0b\x0c]*[\n\.\|:\-][\s\.\|:\-]*')
+_cleanRuns = dict() # cache of the cleaned separators
+
+def _clean_run(match):
+    """
+    Clean a separator (see clean_text), the result only depends on the separator.
+    """
+    run = match.group(0)
+    result = _cleanRuns.get(run)
+    if result is None:
+        if len(_cleanRuns) > 10000:
+            _cleanRuns.clear()
+        result = _clean_separators(run)
+        _cleanRuns[run] = result
+    return result
+
 def clean_text(text):
     """
     Clean the text a bit,
+
+    Single pass version of the cleaning: the characters are replaced first, then each separator
+    (the only parts of the text changed by the regular expressions, see _clean_separators) is
+    cleaned on its own.
+    """
+    text = text.replace('*', '').replace('#', '').replace('\t', ' ').replace('\r', ' ').replace('&', ' and ')
+    return _cleanRun.sub(_clean_run, text)
+
+def _clean_separators(text):
+    """
+    Original version of clean_text after the replacement of the characters.
     """
-    text = text.replace('*', '')
-    text = text.replace('#', '')
-    text = text.replace('\t', ' ')
-    text = text.replace('\r', ' ')
-    text = text.replace('&',' and ')
     text = re.sub(r'\.[\.\s]+', r'.\n\n', text)  # take care of multiple points
     text = re.sub(r'(\n)*(\s)*\|+(\s)*(\n)*', r'', text)  # clean any '|' with space en return around
     text = re.sub(r'--+', r'', text)  # remove ----- character
@@ -0,0 +1,227 @@
+#
+# Author: Albert de Jamblinne de Meux
+# thealbertsmail@gmail.com
+# All right reserved.
+#
+# Under Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International Public License
+# Read the LICENSE.TXT for detail or https://creativecommons.org/licenses/by-nc-sa/4.0/legalcode
+#
+#
+# Benchmark of NEModel on synthetic data (the real documents are confidential):
+#
+#   python NEBenchmark.py --names 10000 100000 --docs 200 --output benchmark.json
+#   python NEBenchmark.py --compare old.json benchmark.json
+#
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import sys
+import time
+
+import numpy as np
+
+import NEModel
+
+# pieces of the synthetic company names.
+SYLLABLES = ['bar', 'clay', 'deut', 'sche', 'gold', 'man', 'sach', 'mor', 'gan', 'stan', 'ley', 'cred',
+             'suisse', 'roy', 'al', 'nat', 'ion', 'west', 'fort', 'pari', 'bas', 'soc', 'gen', 'ing',
+             'citi', 'lloyd', 'san', 'tan', 'der', 'nor', 'dea', 'com', 'merz', 'uni', 'cre', 'dit']
+SUFFIXES = ['plc', 'ag', 'sa', 'inc', 'ltd', 'llc', 'nv', 'bv', 'se', 'spa', 'ab', 'corp', 'limited',
+            'international', 'holdings', 'bank', 'capital', 'finance', 'funding', 'group', 'trust',
+            'aktiengesellschaft', 'public limited company', 'of the', '&']
+SYNONYMES = [('aktiengesellschaft', 'ag'), ('Limited liability company', 'llc'),
+             ('Public limited company', 'plc'), ('incorporation', 'inc'), ('Public Limited', 'ltd'),
+             ('int', 'international'), ('london', 'bishopsgate 110'),
+             ('acting through its london branch', 'great winche'),
+             ('london branch', 'one cabot square')]
+# words of the rest of the documents.
+FILLER = ('the notes are issued under the programme and will be governed by english law ; the terms '
+          '( and conditions ) apply - see page 12 of this document 5% interest @ par $ 100 final '
+          'terms dated series tranche maturity date redemption amount').split()
+# flags of the issuer example.
+BEFORFLAG = ('issue', 'issued')
+AFTERFLAG = ('issuer', 'issued')
+REMOVEFLAG = ('linked to', 'share issuer', 'equity issuer', 'guarantor', 'dealer',
+              'of the issue of securities', 'lead manager', 'notes and certificates of')
+
+
+def company(rand):
+    '''
+    A random company name: 1 to 3 words made of syllables and 0 to 3 legal suffixes.
+    '''
+    words = [''.join(rand.choice(SYLLABLES) for _ in xrange(rand.randint(1, 3)))
+             for _ in xrange(rand.randint(1, 3))]
+    words += rand.sample(SUFFIXES, rand.randint(0, 3))
+    if rand.random() < 0.3:
+        return ' '.join(words).upper()
+    return ' '.join(words).title()
+
+
+def companies(n, seed=0):
+    '''
+    List of n different company names.
+    '''
+    rand = random.Random(seed)
+    result = []
+    seen = set()
+    while len(result) < n:
+        name = company(rand)
+        if name not in seen:
+            seen.add(name)
+            result.append(name)
+    return result
+
+
+def prospectus(names, rand, sentences=100):
+    '''
+    A synthetic prospectus: filler sentences with the issuer, guarantor and dealer phrases.
+
+    Return: the text, the issuer.
+    '''
+    issuer = rand.choice(names)
+    result = []
+    for x in xrange(0, sentences):
+        filler = ' '.join(rand.sample(FILLER, rand.randint(3, 15)))
+        r = rand.random()
+        if r < 0.10:
+            result.append('Issuer: %s. %s' % (issuer, filler))
+        elif r < 0.15:
+            result.append('%s issued by %s acting through its london branch.' % (filler, issuer))
+        elif r < 0.20:
+            result.append('Guarantor: %s . Dealer %s' % (rand.choice(names), rand.choice(names)))
+        elif r < 0.25:
+            result.append('%s Aktiengesellschaft linked to %s lead manager'
+                          % (rand.choice(names), rand.choice(names)))
+        else:
+            result.append(filler)
+    return '\n'.join(result), issuer
+
+
+def _percentiles(times):
+    '''
+    Latency percentiles (seconds) of a list of times.
+    '''
+    times = np.array(times)
+    return {'p50': float(np.percentile(times, 50)), 'p90': float(np.percentile(times, 90)),
+            'p99': float(np.percentile(times, 99)), 'max': float(times.max()),
+            'mean': float(times.mean())}
+
+
+def _peak_memory():
+    '''
+    Peak resident memory of the process (MB).
+    '''
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run(n, docs=200, queries=1000, seed=0):
+    '''
+    Benchmark of a reference set of n names (run it in a new process to measure its own memory).
+
+    Return: dict of the results.
+    '''
+    rand = random.Random(seed)
+    names = companies(n, seed)
+    result = {'names': n, 'memory_start_mb': _peak_memory()}
+
+    t = time.time()
+    m = NEModel.matcher(names, SYNONYMES)
+    result['matcher_build_s'] = time.time() - t
+    result['memory_matcher_mb'] = _peak_memory()
+    result['matcher_size_mb'] = None # not in the older versions of NEModel
+    if hasattr(m, 'memory_usage'):
+        result['matcher_size_mb'] = m.memory_usage()['total'] / 1e6
+
+    # half known names, half random ones.
+    tests = [rand.choice(names) if x % 2 == 0 else company(rand) for x in xrange(0, queries)]
+    for name, method in (('get_Ps', m.get_Ps), ('closerMatch', m.closerMatch)):
+        times = []
+        for words in tests:
+            t = time.time()
+            method(words)
+            times.append(time.time() - t)
+        result[name + '_s'] = _percentiles(times)
+    result['match_many_per_s'] = None # not in the older versions of NEModel
+    if hasattr(m, 'match_many'):
+        t = time.time()
+        for item in m.match_many(tests, workers=1):
+            pass
+        result['match_many_per_s'] = len(tests) / (time.time() - t)
+
+    e = NEModel.extractor(m, BEFORFLAG, AFTERFLAG, REMOVEFLAG, start='+')
+    texts = [prospectus(names, rand) for x in xrange(0, docs)]
+    size = sum(len(text) for text, issuer in texts) / 1e6
+    t = time.time()
+    found = [e.extract(text) for text, issuer in texts]
+    elapsed = time.time() - t
+    result['extract_docs'] = docs
+    result['extract_mb'] = size
+    result['extract_s'] = elapsed
+    result['extract_mb_per_s'] = size / elapsed
+    result['extract_accuracy'] = float(np.mean([f == issuer for f, (text, issuer) in zip(found, texts)]))
+    result['memory_peak_mb'] = _peak_memory()
+    return result
+
+
+def _run(args):
+    return run(*args)
+
+
+def compare(old, new):
+    '''
+    Print the relative change of the results of two benchmark files.
+    '''
+    with open(old) as f:
+        old = dict((item['names'], item) for item in json.load(f)['results'])
+    with open(new) as f:
+        new = dict((item['names'], item) for item in json.load(f)['results'])
+
+    for n in sorted(set(old) & set(new)):
+        print 'names: %d' % n
+        for key in sorted(new[n]):
+            a, b = old[n].get(key), new[n][key]
+            if isinstance(b, dict):
+                a, b = (a or {}).get('p50'), b['p50']
+                key += '.p50'
+            if isinstance(a, (int, float)) and isinstance(b, (int, float)) and a != 0:
+                print '    %-24s %12.6g -> %12.6g  (%+.1f%%)' % (key, a, b, (b - a) * 100.0 / a)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark of NEModel on synthetic data.')
+    parser.add_argument('--names', type=int, nargs='+', default=[10000, 100000],
+                        help='sizes of the reference sets')
+    parser.add_argument('--docs', type=int, default=200, help='number of documents to extract')
+    parser.add_argument('--queries', type=int, default=1000, help='number of names to match')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='benchmark.json', help='file of the results (json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two result files instead of running the benchmark')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = []
+    for n in args.names:
+        # one process per size, for its peak memory.
+        pool = multiprocessing.Pool(1)
+        try:
+            result = pool.apply(_run, ((n, args.docs, args.queries, args.seed),))
+        finally:
+            pool.terminate()
+        print json.dumps(result, sort_keys=True)
+        results.append(result)
+
+    with open(args.output, 'w') as f:
+        json.dump({'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'python': platform.python_version(),
+                   'numpy': np.__version__, 'platform': platform.platform(), 'results': results},
+                  f, indent=1, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -11,9 +11,585 @@ import re
 import numpy as np
 import ordered_set
 import numpy as np
-from collections import defaultdict
+from collections import defaultdict, OrderedDict, deque
 import copy
+import bisect
+import string
+import multiprocessing
+import itertools
 import cPickle as pickle
+import os
+import json
+import hashlib
+import tempfile
+import time
+import mmap
+import sys
+
+# words removed by clean_string (in this order)
+STOPWORDS = ['of', 'the', 'i', 'not', 'and', 'to', 'an', 'a', 'in', 'for', 'on', 'at']
+_stop = '(?:' + '|'.join(STOPWORDS) + ')'
+_stopRun = re.compile(' ' + _stop + '(?: ' + _stop + ')+(?= )') # at least 2 consecutive stop words
+_stopOne = re.compile(' ' + _stop + '(?= )')
+# version of the cleaning, to change each time the result of clean_string change (see tokencache)
+CLEAN_VERSION = 1
+# characters removed by clean_string: all but letters, digits and spaces (\r is removed too)
+_deleted = ''.join(chr(c) for c in xrange(0, 256)
+                   if chr(c) not in string.ascii_letters + string.digits + ' \t\n\x0b\x0c')
+
+
+class _slotted(object):
+    '''
+    Base of the small objects with __slots__ (no __dict__ per object), they can still be pickled
+    with the protocols 0 and 1.
+    '''
+    __slots__ = ()
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name)) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name in state:
+            setattr(self, name, state[name])
+
+
+class lrucache(_slotted):
+    '''
+    Bounded dict, the least recently used entry is removed when it is full.
+    '''
+    __slots__ = ('size', 'data', 'hits', 'misses')
+
+    def __init__(self, size):
+        '''
+        Args:
+            size: maximum number of entries.
+        '''
+        self.size = size
+        self.data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        '''
+        Return the value of key (and mark it as recently used) or default.
+        '''
+        try:
+            value = self.data.pop(key)
+        except KeyError:
+            self.misses += 1
+            return default
+        self.data[key] = value
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key, value):
+        self.data.pop(key, None)
+        self.data[key] = value
+        if len(self.data) > self.size:
+            self.data.popitem(last=False)
+
+    def __len__(self):
+        return len(self.data)
+
+    def clear(self):
+        self.data.clear()
+
+
+def _stop_run(match):
+    '''
+    Remove the stop words of a run of consecutive stop words like one str.replace per stop word
+    would: a stop word directly after the same removed stop word is kept (its space is already
+    used by the previous match). The kept words are marked with \x00 (removed with the
+    ponctuation) so that _stopOne does not remove them.
+    '''
+    words = match.group(0).split(' ')[1:]
+    for stop in STOPWORDS:
+        kept = []
+        removed = False
+        for w in words:
+            if w == stop and not removed:
+                removed = True
+            else:
+                kept.append(w)
+                removed = False
+        words = kept
+    return ''.join(' ' + w + '\x00' for w in words)
+
+
+def _clean_string(s):
+    '''
+    Single pass version of the cleaning (see matcher.clean_string).
+    '''
+    s = s.lower()
+    s = s.replace('&', ' and ').replace('@', ' at ').replace('%', ' percent ').replace('$', ' dolar ')
+    s = _stopOne.sub('', _stopRun.sub(_stop_run, ' ' + s + ' '))
+    if isinstance(s, unicode):
+        s = s.encode('ascii', 'ignore').translate(None, _deleted).decode('ascii')
+    else:
+        s = s.translate(None, _deleted)
+    return ' '.join([s[:0]] + s.split() + [s[:0]]) # remove multiple space...
+
+_cleanCache = lrucache(100000) # for the short strings (names, flags...)
+
+_firstSpace = re.compile(r'[ \t\n\x0b\x0c]')
+_lastSpace = re.compile(r'[ \t\n\x0b\x0c](?=[^ \t\n\x0b\x0c]*$)')
+
+
+# rolling hash of the n-grams (tuples of token ids), see matcher.get_subset_keys
+_hashB = 0x100000001b3
+_hashMask = 2 ** 64 - 1
+
+
+def _gram_key(gram):
+    '''
+    Hash key (int64) of a n-gram (tuple of token ids), same as matcher.get_subset_keys.
+    '''
+    h = 0
+    for t in gram:
+        if t < -1: # corrected word (see matcher._tokens)
+            t = -2 - t
+        h = (h * _hashB + t + 2) & _hashMask
+    h = (h * _hashB + len(gram)) & _hashMask
+    if h >= 2 ** 63:
+        h -= 2 ** 64
+    return h
+
+
+def _unique_factors(keys, factors):
+    '''
+    Sorted unique keys and the largest factor of each (a n-gram found with and without a
+    corrected word, see matcher.get_subset_keys).
+    '''
+    order = np.lexsort((-factors, keys))
+    keys = keys[order]
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    return keys[first], factors[order][first]
+
+
+class automaton(object):
+    '''
+    Aho-Corasick automaton on words: find all the occurrences of several sequences
+    of words (the patterns) in one pass over a list of words.
+    '''
+
+    def __init__(self, patterns):
+        '''
+        Args:
+            patterns: list of tuples of words (not empty).
+        '''
+        self.patterns = list(patterns)
+        self.symbols = dict() # word -> symbol of the word
+        self.goto = [dict()] # transitions of each state
+        self.out = [[]] # patterns ending at each state
+        for pid in xrange(0, len(self.patterns)):
+            state = 0
+            for w in self.patterns[pid]:
+                sym = self.symbols.setdefault(w, len(self.symbols))
+                if sym not in self.goto[state]:
+                    self.goto[state][sym] = len(self.goto)
+                    self.goto.append(dict())
+                    self.out.append([])
+                state = self.goto[state][sym]
+            self.out[state].append(pid)
+
+        # failure links, breadth first.
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while len(queue) > 0:
+            state = queue.popleft()
+            for sym, nxt in self.goto[state].items():
+                queue.append(nxt)
+                f = self.fail[state]
+                while f != 0 and sym not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(sym, 0)
+                self.out[nxt] = self.out[nxt] + self.out[self.fail[nxt]]
+
+    def search(self, words):
+        '''
+        Find all the occurrences of the patterns in words.
+
+        Return: dict pattern index -> list of the positions where it start (increasing).
+        '''
+        result = defaultdict(list)
+        symbols = self.symbols
+        state = 0
+        last = -2
+        # only the words of the patterns move the automaton, any other word reset it.
+        for x in [x for x, w in enumerate(words) if w in symbols]:
+            if x != last + 1:
+                state = 0
+            last = x
+            sym = symbols[words[x]]
+            while state != 0 and sym not in self.goto[state]:
+                state = self.fail[state]
+            state = self.goto[state].get(sym, 0)
+            for pid in self.out[state]:
+                result[pid].append(x - len(self.patterns[pid]) + 1)
+        return result
+
+
+def _matches(starts, n, plain):
+    '''
+    Occurrences of a pattern of n words which str.replace would replace in the text
+    (leftmost non overlapping occurrences, two occurrences can not share a single space).
+
+    Args:
+        starts: positions where the pattern start (increasing).
+        n: number of words of the pattern.
+        plain: function of the index of a gap (gap x is before word x) returning True if the
+            gap is a single space. The pattern can only match over single spaces.
+    '''
+    result = []
+    end = -1
+    for x in starts:
+        if x < end or (x == end and plain(x)):
+            continue
+        if all(plain(g) for g in xrange(x + 1, x + n)):
+            result.append(x)
+            end = x + n
+    return result
+
+
+def _replace(words, starts, n, by):
+    '''
+    Replace the occurrences (see _matches) of a pattern of n words starting at starts by the list
+    of words by.
+    '''
+    result = []
+    prev = 0
+    for x in _matches(starts, n, lambda g: True):
+        result.extend(words[prev:x])
+        result.extend(by)
+        prev = x + n
+    result.extend(words[prev:])
+    return result
+
+
+# binary format of the saved models (see matcher.save and extractor.save)
+MODEL_FORMAT = 1
+
+class stringarray(_slotted):
+    '''
+    Read only list of strings stored in one buffer of bytes: the string x is
+    buf[offsets[x]:offsets[x + 1]] (decoded if an encoding is given).
+    '''
+    __slots__ = ('buf', 'offsets', 'encoding')
+
+    def __init__(self, buf, offsets, encoding=None):
+        self.buf = buf
+        self.offsets = offsets
+        self.encoding = encoding
+
+    @classmethod
+    def from_list(cls, strings):
+        '''
+        Pack a list of strings, the unicode strings are encoded in utf-8 (and all the strings are
+        then decoded when read).
+        '''
+        encoding = None
+        if any(isinstance(s, unicode) for s in strings):
+            encoding = 'utf-8'
+            strings = [s if isinstance(s, unicode) else s.decode('utf-8') for s in strings]
+            strings = [s.encode(encoding) for s in strings]
+        offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(s) for s in strings])
+        return cls(np.frombuffer(''.join(strings), dtype=np.uint8), offsets, encoding)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, x):
+        if x < 0:
+            x += len(self)
+        if not 0 <= x < len(self):
+            raise IndexError('stringarray index out of range')
+        s = self.buf[self.offsets[x]:self.offsets[x + 1]].tostring()
+        if self.encoding is not None:
+            return s.decode(self.encoding)
+        return s
+
+    def __iter__(self):
+        buf = self.buf.tostring()
+        for x in xrange(0, len(self)):
+            s = buf[self.offsets[x]:self.offsets[x + 1]]
+            yield s.decode(self.encoding) if self.encoding is not None else s
+
+
+def _small_floats(a):
+    '''
+    a in float32 if it is exact (lengths, k sums and weights are integers), else in float64.
+    '''
+    small = a.astype(np.float32)
+    if np.array_equal(small, a):
+        return small
+    return a.astype(np.float64)
+
+def _mapped(a):
+    '''
+    True if the memory of the array a is a memory mapped file (see _load_model).
+    '''
+    while a is not None:
+        if isinstance(a, mmap.mmap):
+            return True
+        a = getattr(a, 'base', None)
+    return False
+
+def _strings_size(strings, shared=False):
+    '''
+    Estimated memory (bytes) of a list of strings: the buffers of a stringarray, the list, the
+    dict and the string objects of an OrderedSet or the table and the keys of a dict (the keys
+    not counted if shared, when they are the strings of an other structure).
+    '''
+    if isinstance(strings, stringarray):
+        return strings.buf.nbytes + strings.offsets.nbytes
+    if isinstance(strings, ordered_set.OrderedSet):
+        result = sys.getsizeof(strings.items) + sys.getsizeof(strings.map)
+        result += len(strings) * sys.getsizeof(len(strings)) # (the index of the map)
+        keys = strings.items
+    else:
+        result = sys.getsizeof(strings) + len(strings) * sys.getsizeof(len(strings))
+        keys = strings
+    if not shared:
+        result += sum(sys.getsizeof(s) for s in keys)
+    return result
+
+
+def _save_model(dirname, kind, header, arrays):
+    '''
+    Write a model in the directory dirname: header.json (format, kind of model and header) and
+    one .npy file per array.
+    '''
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    for name in arrays:
+        np.save(os.path.join(dirname, name + '.npy'), np.ascontiguousarray(arrays[name]))
+    header = dict(header, format=MODEL_FORMAT, kind=kind, arrays=sorted(arrays))
+    with open(os.path.join(dirname, 'header.json'), 'wb') as output:
+        json.dump(header, output, indent=1, sort_keys=True)
+
+def _load_model(dirname, kind):
+    '''
+    Read a model written by _save_model, the arrays are memory mapped (read only).
+
+    Return: header, dict of the arrays.
+    '''
+    with open(os.path.join(dirname, 'header.json'), 'rb') as f:
+        header = json.load(f)
+    if header.get('kind') != kind:
+        raise ValueError('%s is not a saved %s' % (dirname, kind))
+    if header.get('format') != MODEL_FORMAT:
+        raise ValueError('%s: unsupported model format %r (expected %d)'
+                         % (dirname, header.get('format'), MODEL_FORMAT))
+    arrays = dict()
+    for name in header['arrays']:
+        # plain array on the mapped memory (the operations on a np.memmap are slower)
+        arrays[name] = np.load(os.path.join(dirname, name + '.npy'), mmap_mode='r').view(np.ndarray)
+    return header, arrays
+
+def _str(s):
+    '''
+    json gives unicode strings, back to str for the ascii ones (the cleaned strings).
+    '''
+    try:
+        return str(s)
+    except UnicodeEncodeError:
+        return s
+
+
+class stats(object):
+    '''
+    Timings (seconds) and counters of the stages of the extraction, opt-in (see
+    extractor.enable_stats): nothing is measured when the stats of the extractor and of the
+    matcher are None.
+
+    The totals are in self.times, self.counts and self.peaks (maxima). The records of each text
+    (kind 'document': cleaning, global replacements, flags, parsing, synonyms) and of each
+    matching of the groups (kind 'select': cache, scoring) are given to the callback, if any,
+    as a dict with kind, times, counts and peaks.
+    '''
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.times = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.peaks = defaultdict(int)
+        self.record = None
+
+    def begin(self):
+        '''
+        Start a record, return the time.
+        '''
+        if self.callback is not None:
+            self.record = {'times': defaultdict(float), 'counts': defaultdict(int), 'peaks': defaultdict(int)}
+        return time.time()
+
+    def lap(self, name, t):
+        '''
+        Add the time since t to the stage name, return the time.
+        '''
+        now = time.time()
+        self.times[name] += now - t
+        if self.record is not None:
+            self.record['times'][name] += now - t
+        return now
+
+    def count(self, name, n=1):
+        self.counts[name] += n
+        if self.record is not None:
+            self.record['counts'][name] += n
+
+    def peak(self, name, n):
+        self.peaks[name] = max(self.peaks[name], n)
+        if self.record is not None:
+            self.record['peaks'][name] = max(self.record['peaks'][name], n)
+
+    def end(self, kind):
+        '''
+        End the record and give it to the callback.
+        '''
+        record, self.record = self.record, None
+        if record is not None:
+            self.callback({'kind': kind, 'times': dict(record['times']),
+                           'counts': dict(record['counts']), 'peaks': dict(record['peaks'])})
+
+    def summary(self):
+        '''
+        Return: dict of the totals (to export).
+        '''
+        return {'times': dict(self.times), 'counts': dict(self.counts), 'peaks': dict(self.peaks)}
+
+
+def _deletes(word, n):
+    '''
+    The strings obtained by removing up to n characters of word (word included).
+    '''
+    result = set([word])
+    last = result
+    for d in xrange(0, n):
+        last = set(w[:x] + w[x + 1:] for w in last for x in xrange(0, len(w)))
+        result |= last
+    return result
+
+
+def _distance(a, b, n):
+    '''
+    Edit distance between a and b (insertions, deletions, substitutions and transpositions of
+    two adjacent characters), n + 1 if it is larger than n.
+    '''
+    if abs(len(a) - len(b)) > n:
+        return n + 1
+    # the common prefix and suffix do not change the distance.
+    x = 0
+    while x < len(a) and x < len(b) and a[x] == b[x]:
+        x += 1
+    y = 0
+    while y < len(a) - x and y < len(b) - x and a[-1 - y] == b[-1 - y]:
+        y += 1
+    a = a[x:len(a) - y]
+    b = b[x:len(b) - y]
+    if len(a) == 0 or len(b) == 0:
+        return min(max(len(a), len(b)), n + 1)
+
+    prev2 = None
+    prev = range(0, len(b) + 1)
+    for x in xrange(1, len(a) + 1):
+        cur = [x] + [0] * len(b)
+        for y in xrange(1, len(b) + 1):
+            d = min(prev[y] + 1, cur[y - 1] + 1, prev[y - 1] + (a[x - 1] != b[y - 1]))
+            if x > 1 and y > 1 and a[x - 1] == b[y - 2] and a[x - 2] == b[y - 1]:
+                d = min(d, prev2[y - 2] + 1)
+            cur[y] = d
+        if min(cur) > n:
+            return n + 1
+        prev2, prev = prev, cur
+    return min(prev[-1], n + 1)
+
+
+class typoindex(_slotted):
+    '''
+    Deletion index of a vocabulary (symmetric delete, as SymSpell) to find the word of the
+    vocabulary closest to a misspelled word.
+
+    Each word is indexed by the strings obtained by removing up to maxDistance characters of its
+    prefix. A word within maxDistance of an unknown word shares one of these strings with it, so
+    the candidates are found with a few lookups in the sorted hashes of the strings, and checked
+    with the exact distance. Only the words made of letters, of at least minLength characters,
+    are indexed and corrected (the short words and the numbers are too ambiguous).
+    '''
+    __slots__ = ('vocab', 'counts', 'maxDistance', 'minLength', 'prefixLength', 'hashes', 'ids',
+                 'cacheSize', 'cache')
+
+    def __init__(self, vocab, counts, maxDistance=2, minLength=5, prefixLength=7, cacheSize=100000):
+        '''
+        Args:
+            vocab: list of the words.
+            counts: number of names of each word (the most used word is chosen in case of equality).
+            maxDistance: maximum edit distance of a correction.
+            minLength: minimum length of the words.
+            prefixLength: number of characters of the words indexed (bound the size of the index,
+                the end of the words is only used by the check of the distance).
+            cacheSize: number of corrections kept (the cache is emptied when it is full).
+        '''
+        self.vocab = vocab
+        self.counts = counts
+        self.maxDistance = maxDistance
+        self.minLength = minLength
+        self.prefixLength = prefixLength
+
+        hashes = []
+        ids = []
+        for x in xrange(0, len(vocab)):
+            w = vocab[x]
+            if len(w) >= minLength and w.isalpha():
+                for item in _deletes(w[:prefixLength], maxDistance):
+                    hashes.append(hash(item))
+                    ids.append(x)
+        hashes = np.array(hashes, dtype=np.int64)
+        ids = np.array(ids, dtype=np.int32)
+        order = np.lexsort((ids, hashes))
+        self.hashes = hashes[order] # sorted hashes of the deleted strings
+        self.ids = ids[order] # word of each of them
+        self.cacheSize = cacheSize
+        self.cache = dict() # (a lrucache is too slow here, most words of a text are unknown)
+
+    def correct(self, word):
+        '''
+        Return: index of the word of the vocabulary closest to word (the shortest distance, then
+            the most used, then the first), None if there is none within maxDistance.
+        '''
+        if len(word) < self.minLength:
+            return None
+        x = self.cache.get(word)
+        if x is None:
+            x = self._find(word)
+            if len(self.cache) >= self.cacheSize:
+                self.cache.clear()
+            self.cache[word] = x
+        if x < 0:
+            return None
+        return x
+
+    def _find(self, word):
+        if not word.isalpha():
+            return -1
+        h = np.array([hash(item) for item in _deletes(word[:self.prefixLength], self.maxDistance)],
+                     dtype=np.int64)
+        start = np.searchsorted(self.hashes, h)
+        end = np.searchsorted(self.hashes, h, side='right')
+        candidates = set()
+        for x in np.flatnonzero(end > start):
+            candidates.update(self.ids[start[x]:end[x]].tolist())
+
+        best = (self.maxDistance + 1, 0, -1)
+        for x in candidates:
+            # (only the words as close as the best one found so far are of interest)
+            d = _distance(word, self.vocab[x], min(best[0], self.maxDistance))
+            if d <= self.maxDistance:
+                best = min(best, (d, -self.counts[x], x))
+        return best[2]
+
 
 class matcher(object):
     '''
@@ -21,7 +597,8 @@ class matcher(object):
     of data and on the order of the word.
 
     The goal is the match a name (composed of several word), or short sentences with a set of a reference data.
-    Spelling madder ! Misspelling is not handel (Test of use of fuzzy matching did not bring good results...)
+    Spelling madder ! Misspelling is not handel by default (Test of use of fuzzy matching did not bring good results...),
+    see enable_typos for the correction of the unknown words close to a word of the names.
     '''
 
     def __init__(self, values, synonymes):
@@ -47,21 +624,362 @@ class matcher(object):
                 if len(voc) > 0: # do not add empty string
                     self.vocab.add(voc)
 
-        self.Lookup = dict()  # for fast retrieval of the index
+        self._Lookup = dict()  # for fast retrieval of the index
         for x in xrange(0, len(self.vocab)):
-            self.Lookup[self.vocab[x]] = x
+            self._Lookup[self.vocab[x]] = x
+
+        # per name arrays (see _append) and feature matrix (see _build_matrix), empty.
+        self.l = np.zeros(0, dtype=np.float32) # len of the each name
+        self.sumkVal = np.zeros(0, dtype=np.float32) # k values for the computation of the probability
+        self.tokens = np.zeros(0, dtype=np.int32)
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.distinct = np.zeros(0, dtype=bool)
+        self.removed = np.zeros(0, dtype=bool)
+        self._set_matrix(np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), np.zeros(0))
+        self.maxlen = 0
+
+        self._append([self._tokens(item) for item in values])
+
+        # changed each time the reference set change (for the caches of the extractors).
+        self.version = 0
+
+    # timings and counters (see the class stats), None to not measure anything.
+    stats = None
+    # correction of the unknown words (see enable_typos), None to not correct them.
+    typos = None
+    # regular expression of the synonyms (see _alternatives), built at the first use.
+    _synonymIndex = None
+    # codes of the entries of the feature matrix (see _codes), built at the first use.
+    _entries = None
+    # weight of a n-gram with a corrected word, per corrected word.
+    typoWeight = 0.5
+
+    def __getstate__(self):
+        # the stats are not saved.
+        state = self.__dict__.copy()
+        state.pop('stats', None)
+        state.pop('_entries', None) # (built again when needed)
+        state.pop('_synonymIndex', None)
+        return state
+
+    def __setstate__(self, state):
+        if 'tokens' not in state:
+            # pickled by a version without the token arrays and the feature matrix: built again
+            # from the names (the synonyms are already clean).
+            self.__init__(list(state['values']), [])
+            self.synonymes = state['synonymes']
+            return
+        self.__dict__.update(state)
+
+    def enable_typos(self, maxDistance=2, minLength=5, weight=0.5):
+        '''
+        Correct the unknown words (see typoindex): a word which is not in the vocabulary is replaced
+        by the closest word of the vocabulary, within maxDistance, and the n-grams with corrected
+        words have a lower weight in the probabilities. This apply to the strings to match and to
+        the texts of the extractors.
+
+        Args:
+            maxDistance: maximum edit distance of a correction.
+            minLength: minimum length of the corrected words.
+            weight: factor of the weight of a n-gram for each corrected word in it.
 
-        self.vector = [] # number form of each name
-        self.l = [] # len of the each name
+        Return: the typoindex.
+        '''
+        counts = np.bincount(self.tokens, minlength=len(self.vocab))
+        self.typos = typoindex(self.vocab, counts, maxDistance, minLength)
+        self.typoWeight = weight
+        self.version += 1
+        return self.typos
+
+    def disable_typos(self):
+        '''
+        Stop the correction of the unknown words (see enable_typos).
+        '''
+        self.typos = None
+        self.version += 1
+
+    @property
+    def Lookup(self):
+        '''
+        Index of each word of the vocabulary (built at the first use for a loaded model).
+        '''
+        if self._Lookup is None:
+            self._Lookup = dict((w, x) for x, w in enumerate(self.vocab))
+        return self._Lookup
+
+    @property
+    def vector(self):
+        '''
+        Number form of each name (see get_subsets), computed from self.tokens.
+        '''
+        return [self.get_subsets(self.tokens[self.offsets[x]:self.offsets[x + 1]].tolist())
+                for x in xrange(0, len(self.l))]
+
+    def _append(self, names):
+        '''
+        Add names at the end of the per name arrays:
+
+        self.l, self.sumkVal: length and k sum value (see _sumk) of each name, in float32 when it is
+            exact (see _small_floats, the probabilities are computed in float64).
+        self.tokens, self.offsets: the token ids of the name x are self.tokens[self.offsets[x]:self.offsets[x + 1]]
+        self.distinct: True for the names without repeated word.
+        self.removed: True for the names removed by remove_values (tombstones).
+
+        and in the feature matrix.
+
+        Args:
+            names: list of (token ids, length) of the names (see _tokens).
+        '''
+        first = len(self.l)
+        vector = [self.get_subsets(t) for t, l in names]
+        self.l = _small_floats(np.concatenate((self.l, np.array([l for t, l in names], dtype=np.float64))))
+        self.sumkVal = _small_floats(np.concatenate((self.sumkVal, np.array([self._sumk(item) for item in vector],
+                                                                            dtype=np.float64))))
+        lengths = np.array([len(t) for t, l in names], dtype=np.int64)
+        self.offsets = np.concatenate((self.offsets, self.offsets[-1] + np.cumsum(lengths)))
+        self.tokens = np.concatenate((self.tokens, np.array([w for t, l in names for w in t], dtype=np.int32)))
+        distinct = [len(vector[x].get(1, ())) == names[x][1] for x in xrange(0, len(names))]
+        self.distinct = np.concatenate((self.distinct, np.array(distinct, dtype=bool)))
+        self.removed = np.concatenate((self.removed, np.zeros(len(names), dtype=bool)))
+
+        self._build_matrix(vector, first)
+
+    def _build_matrix(self, vector, first=0):
+        '''
+        Add the names first, first + 1, ... (their subsets in vector) to the weighted feature matrix
+        of the names, (names x n-grams) sparse matrix stored column wise:
+
+        self.keys: sorted hash keys of the n-grams (see get_subset_keys), key of each column.
+        self.indptr, self.indices: the names of column c are self.indices[self.indptr[c]:self.indptr[c + 1]]
+            (int32, indptr in int64 for more than 2 ** 31 entries).
+        self.weights: weight of each column, k ** 2 for a n-gram of size k (as in _sumk), float32.
+        self.maxlen: size of the largest n-gram.
+
+        Only the entries of the new names are sorted, they are merged in the columns (after the
+        entries of the other names, which have a lower index).
+        '''
+        features = dict() # n-gram -> key
+        keys = []
+        names = []
+        weights = []
+        for x in xrange(0, len(vector)):
+            for k in vector[x]:
+                for gram in vector[x][k]:
+                    if gram not in features:
+                        features[gram] = _gram_key(gram)
+                    keys.append(features[gram])
+                    names.append(first + x)
+                    weights.append(k ** 2.0)
+        self.maxlen = max([self.maxlen] + [k for item in vector for k in item])
+
+        keys = np.array(keys, dtype=np.int64)
+        order = np.lexsort((names, keys))
+        keys = keys[order]
+        names = np.array(names, dtype=np.int32)[order]
+        columns = np.ones(len(keys), dtype=bool) # first entry of each column
+        columns[1:] = keys[1:] != keys[:-1]
+        counts = np.diff(np.append(np.flatnonzero(columns), len(keys)))
+        weights = np.array(weights, dtype=np.float64)[order][columns]
+        keys = keys[columns]
+
+        # column of each new key in the matrix, the new columns are inserted before pos.
+        pos = np.searchsorted(self.keys, keys)
+        found = pos < len(self.keys)
+        found[found] = self.keys[pos[found]] == keys[found]
+        # the entries go at the end of their column (the start of the next one for a new column).
+        self.indices = np.insert(self.indices, np.repeat(self.indptr[pos + found], counts), names)
+        sizes = self.indptr[1:] - self.indptr[:-1]
+        sizes[pos[found]] += counts[found]
+        sizes = np.insert(sizes, pos[~found], counts[~found])
+        self.keys = np.insert(self.keys, pos[~found], keys[~found])
+        self.weights = _small_floats(np.insert(self.weights.astype(np.float64), pos[~found], weights[~found]))
+        self.indptr = np.append(0, np.cumsum(sizes))
+        self.indptr = self.indptr.astype(np.int32 if len(self.indices) < 2 ** 31 else np.int64)
+        self._entries = None
+
+    def _set_matrix(self, keys, names, weights, ordered=False):
+        '''
+        Set the feature matrix (see _build_matrix) from its entries.
+
+        Args:
+            keys, names, weights: key of the n-gram, name and weight of each entry.
+            ordered: True if the entries are already sorted by key and name.
+        '''
+        if not ordered:
+            order = np.lexsort((names, keys))
+            keys, names, weights = keys[order], names[order], weights[order]
+        columns = np.ones(len(keys), dtype=bool) # first entry of each column
+        columns[1:] = keys[1:] != keys[:-1]
+        self.keys = keys[columns]
+        self.weights = _small_floats(weights[columns])
+        self.indices = names.astype(np.int32)
+        self.indptr = np.append(np.flatnonzero(columns), len(keys))
+        self.indptr = self.indptr.astype(np.int32 if len(keys) < 2 ** 31 else np.int64)
+        self._entries = None
+
+    def _mutable(self):
+        '''
+        Make a loaded model (see from_file) modifiable: the vocabulary and the names back in
+        OrderedSets, the tombstones in a writable array.
+        '''
+        if not isinstance(self.vocab, ordered_set.OrderedSet):
+            self.vocab = ordered_set.OrderedSet(self.vocab)
+        if not isinstance(self.values, ordered_set.OrderedSet):
+            self.values = ordered_set.OrderedSet(self.values)
+        self.removed = np.array(self.removed)
+
+    def add_values(self, values):
+        '''
+        Add names to the reference set without rebuilding the model. The new words are added
+        at the end of the vocabulary (the token ids of the other words do not change), the new
+        names at the end of self.values. A removed name (see remove_values) which is added
+        again is restored.
+
+        Args:
+            values: list of the names to add.
+        '''
+        self._mutable()
+        lookup = self.Lookup
+        new = ordered_set.OrderedSet()
+        for item in values:
+            if item in self.values:
+                self.removed[self.values.index(item)] = False
+            else:
+                new.add(item)
+
+        for item in new:
+            for voc in self.clean_string(item).split():
+                if voc not in lookup:
+                    lookup[voc] = len(self.vocab)
+                    self.vocab.add(voc)
+
+        self._append([self._tokens(item) for item in new])
+        for item in new:
+            self.values.add(item)
+        self.version += 1
+        if self.typos is not None: # index of the new words.
+            self.enable_typos(self.typos.maxDistance, self.typos.minLength, self.typoWeight)
+
+    def remove_values(self, values, compaction=0.25):
+        '''
+        Remove names from the reference set. They are only marked as removed (tombstones, they
+        do not match anymore) and the model is compacted (see compact) when more than the
+        fraction compaction of the names are removed. The names which are not in the reference
+        set are ignored.
+
+        Args:
+            values: list of the names to remove.
+            compaction: fraction of removed names triggering the compaction.
+        '''
+        self._mutable()
         for item in values:
-            v, l = self.to_numberset(item)
-            self.vector.append(v)
-            self.l.append(l)
+            if item in self.values:
+                self.removed[self.values.index(item)] = True
+        self.version += 1
+
+        if self.removed.sum() > compaction * len(self.removed):
+            self.compact()
+
+    def compact(self):
+        '''
+        Remove for good the names removed by remove_values. The index of the names after them in
+        self.values change. The vocabulary is kept (the token ids do not change).
+        '''
+        keep = ~self.removed
+        if keep.all():
+            return
 
-        # compute k values for the computation of the probability
-        self.sumkVal = []
-        for item in self.vector:
-            self.sumkVal.append(self._sumk(item))
+        self._mutable()
+        lengths = self.offsets[1:] - self.offsets[:-1]
+        self.tokens = self.tokens[np.repeat(keep, lengths)]
+        self.offsets = np.append(0, np.cumsum(lengths[keep])).astype(np.int64)
+        self.l = self.l[keep]
+        self.sumkVal = self.sumkVal[keep]
+        self.distinct = self.distinct[keep]
+        self.values = ordered_set.OrderedSet(item for item, k in zip(self.values, keep) if k)
+
+        # new index of the names, and entries of the matrix of the names kept.
+        index = np.cumsum(keep) - 1
+        counts = self.indptr[1:] - self.indptr[:-1]
+        entries = keep[self.indices]
+        self._set_matrix(np.repeat(self.keys, counts)[entries], index[self.indices[entries]],
+                         np.repeat(self.weights, counts)[entries], ordered=True)
+        self.maxlen = int(lengths[keep].max()) if keep.any() else 0
+
+        self.removed = np.zeros(len(self.l), dtype=bool)
+        self.version += 1
+
+    def pack(self):
+        '''
+        Store the names and the vocabulary in flat buffers (stringarray, as a loaded model) instead
+        of OrderedSets of python strings. They are read a bit slower, and are back in OrderedSets at
+        the next change of the reference set (see _mutable). The Lookup keeps its own strings.
+        '''
+        self.vocab = stringarray.from_list(list(self.vocab))
+        self.values = stringarray.from_list(list(self.values))
+        if self.typos is not None:
+            self.typos.vocab = self.vocab
+
+    def subset(self, start, end):
+        '''
+        Matcher of the names start, ..., end - 1 (see shardedmatcher). It shares the vocabulary, the
+        synonyms and the typo correction of this matcher: the token ids, the n-grams and the
+        probabilities of its names are the same, and it must not be modified (add_values...).
+
+        Return: the matcher, its name x is the name start + x of this one.
+        '''
+        result = copy.copy(self)
+        result.values = stringarray.from_list([self.values[x] for x in xrange(start, end)])
+        result.tokens = np.array(self.tokens[self.offsets[start]:self.offsets[end]])
+        result.offsets = self.offsets[start:end + 1] - self.offsets[start]
+        for name in ('l', 'sumkVal', 'distinct', 'removed'):
+            setattr(result, name, np.array(getattr(self, name)[start:end]))
+
+        counts = self.indptr[1:] - self.indptr[:-1]
+        entries = (self.indices >= start) & (self.indices < end)
+        result._set_matrix(np.repeat(self.keys, counts)[entries], self.indices[entries].astype(np.int64) - start,
+                           np.repeat(self.weights, counts)[entries], ordered=True)
+        lengths = result.offsets[1:] - result.offsets[:-1]
+        result.maxlen = int(lengths.max()) if len(lengths) > 0 else 0
+        return result
+
+    def memory_usage(self):
+        '''
+        Memory used by each structure of the matcher (bytes, estimated for the python objects with
+        sys.getsizeof), to size the pools of processes. The arrays of a loaded model (see from_file)
+        are memory mapped: they are also counted in 'mapped', these pages are shared by the
+        processes and only read when they are used.
+
+        Return: OrderedDict structure -> bytes, with the 'total' and the 'mapped' bytes.
+        '''
+        result = OrderedDict()
+        mapped = 0
+        arrays = [(name, getattr(self, name)) for name in self._arrays] + [('codes', self._entries)]
+        if isinstance(self.vocab, stringarray):
+            arrays += [('vocab', self.vocab.buf), ('vocab_offsets', self.vocab.offsets)]
+        if isinstance(self.values, stringarray):
+            arrays += [('values', self.values.buf), ('values_offsets', self.values.offsets)]
+        for name, a in arrays:
+            if a is not None:
+                result[name] = a.nbytes
+                if _mapped(a):
+                    mapped += a.nbytes
+
+        if not isinstance(self.vocab, stringarray):
+            result['vocab'] = _strings_size(self.vocab)
+        if not isinstance(self.values, stringarray):
+            result['values'] = _strings_size(self.values)
+        # (the keys of the Lookup are the strings of the vocabulary, until it is packed)
+        if self._Lookup is not None:
+            result['Lookup'] = _strings_size(self._Lookup, isinstance(self.vocab, ordered_set.OrderedSet))
+        result['synonymes'] = _strings_size([s for pair in self.synonymes for s in pair])
+        if self.typos is not None:
+            result['typos'] = (self.typos.hashes.nbytes + self.typos.ids.nbytes + self.typos.counts.nbytes +
+                               _strings_size(self.typos.cache))
+
+        result['total'] = sum(result.values())
+        result['mapped'] = mapped
+        return result
 
     def get_subsets(self, valueSet):
         '''
@@ -88,21 +1006,18 @@ class matcher(object):
     def clean_string(self,s):
         '''
         Clean the string. Remove ponctuation, lower the case and remove line break
+
+        The strings shorter than 256 characters are cached.
         '''
-        s = s.lower()
-        s = s.replace('&',' and ')
-        s = s.replace('@', ' at ')
-        s = s.replace('%', ' percent ')
-        s = s.replace('$', ' dolar ')
-        s = ' '+s+' '
-        for item in [' of ', ' the ', ' i ', ' not ', ' and ', ' to ', ' an ', ' a ', ' in ', ' for ', ' on ', ' at ']:
-            s = s.replace(item, ' ')
-        s = re.sub("[^a-zA-Z0-9\s]",
-                      "",
-                      s)
-
-        s = s.replace('\n', ' ').replace('\r', '')
-        return re.sub('\s+',' ',s) # remove multiple space...
+        if len(s) >= 256:
+            return _clean_string(s)
+
+        key = (type(s), s)
+        result = _cleanCache.get(key)
+        if result is None:
+            result = _clean_string(s)
+            _cleanCache[key] = result
+        return result
 
     def to_numberset(self, words):
         '''
@@ -110,20 +1025,33 @@ class matcher(object):
 
         Return a number set version of the string. Each word is replace by a number
         which is the position of this word in vocab. if the word is not in the vocab,
-        -1 is put. Then return the set of number.
+        -1 is put (or -2 - the position of its correction, see enable_typos). Then return
+        the set of number.
 
         Return set of number, word length of the string.
         '''
+        result, l = self._tokens(words)
+        return self.get_subsets(result), l
+
+    def _tokens(self, words):
+        '''
+        Number form of the string before get_subsets (see to_numberset).
+
+        Return list of number, word length of the string.
+        '''
         result = []
         l = 0.0
         tmp = self.clean_string(words)
+        lookup = self.Lookup
+        typos = self.typos
         for w in tmp.split():
             if len(w) > 0:
                 l += 1.0
-                if w in self.Lookup:
-                    result.append(self.Lookup[w])
+                if w in lookup:
+                    result.append(lookup[w])
                 else:
-                    result.append(-1)
+                    x = typos.correct(w) if typos is not None else None
+                    result.append(-1 if x is None else -2 - x)
 
         x = 0
         while len(result) > x + 1:
@@ -132,7 +1060,7 @@ class matcher(object):
             else:
                 x += 1
 
-        return self.get_subsets(result), l
+        return result, l
 
     def _sumk(self, sets):
         '''
@@ -143,87 +1071,762 @@ class matcher(object):
             r += k ** 2.0 * len(sets[k])
         return float(r)
 
+    def get_subset_keys(self, valueSet):
+        '''
+        Get the hash keys of the subsets of a list (see get_subsets). The subsets larger than
+        the largest name are ignored (they can not match). Two different subsets could have the
+        same key, this is very unlikely with a 64 bits hash.
+
+        Return: (array of the keys of the subsets (int64), size of the list), and if there are
+            corrected words (see _tokens) the factor of the weight of each key (see _factors).
+        '''
+        valueSet = [item if isinstance(item, int) else -1 for item in valueSet]
+        if len(set(valueSet)) < len(valueSet):
+            # with a repeated word, get_subsets does not give the plain n-grams of the list (and it
+            # is used for the names and sumkVal): its subsets are hashed one by one.
+            keys, factors = self._factors(self.get_subsets(valueSet))
+            if factors is None:
+                return keys, float(len(valueSet))
+            return keys, float(len(valueSet)), factors
+        t = np.array(valueSet, dtype=np.int64)
+        typo = t < -1
+        if typo.any():
+            t = np.where(typo, -2 - t, t)
+        t = (t + 2).astype(np.uint64)
+        b = np.uint64(_hashB)
+
+        keys = []
+        counts = [] # number of corrected words of each subset
+        h = t
+        c = typo.astype(np.int64)
+        for k in xrange(1, min(len(t), self.maxlen) + 1):
+            if k > 1:
+                h = h[:-1] * b + t[k - 1:]
+                c = c[:-1] + typo[k - 1:]
+            keys.append(h * b + np.uint64(k))
+            counts.append(c)
+
+        if len(keys) == 0:
+            return np.zeros(0, dtype=np.int64), float(len(t))
+        if not typo.any():
+            return np.unique(np.concatenate(keys).view(np.int64)), float(len(t))
+        keys, factors = _unique_factors(np.concatenate(keys).view(np.int64),
+                                        self.typoWeight ** np.concatenate(counts))
+        return keys, float(len(t)), factors
+
+    def _factors(self, toTest):
+        '''
+        Keys of the subsets of a vector (get_subsets) and the factor of their weight:
+        self.typoWeight ** number of corrected words (see _tokens) in the subset.
+
+        Return: keys (sorted), factors (None if there is no corrected word).
+        '''
+        grams = [gram for size in toTest for gram in toTest[size]]
+        keys = np.array([_gram_key(gram) for gram in grams], dtype=np.int64)
+        if not any(gram[0] < -1 for gram in toTest.get(1, ())):
+            return np.unique(keys), None
+        factors = self.typoWeight ** np.array([sum(1 for t in gram if t < -1) for gram in grams])
+        return _unique_factors(keys, factors)
+
+    def _columns(self, toTests):
+        '''
+        Columns of the n-grams of each of the provided vectors which are in the feature matrix.
+
+        Args:
+            toTests: list of vectors, as returned by get_subsets or get_subset_keys.
+
+        Return: columns, index of the vector each column belong to, factor of the weight of
+            each column (None if there is no corrected word, see _factors).
+        '''
+        keys = []
+        queries = []
+        factors = []
+        for q in xrange(0, len(toTests)):
+            if isinstance(toTests[q], dict):
+                k, f = self._factors(toTests[q])
+            else:
+                k = toTests[q][0]
+                f = toTests[q][2] if len(toTests[q]) > 2 else None
+            keys.append(k)
+            queries.append(np.zeros(len(k), dtype=np.int64) + q)
+            factors.append(f)
+
+        if len(keys) == 0 or len(self.keys) == 0:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64), None
+
+        if all(f is None for f in factors):
+            factors = None
+        else:
+            factors = np.concatenate([np.ones(len(k)) if f is None else f for k, f in zip(keys, factors)])
+        keys = np.concatenate(keys)
+        queries = np.concatenate(queries)
+        if self.stats is not None:
+            self.stats.count('subsets', len(keys))
+        cols = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        found = self.keys[cols] == keys
+        if factors is not None:
+            factors = factors[found]
+        return cols[found], queries[found], factors
+
+    def _product(self, cols, queries, ls, factors=None):
+        '''
+        Sparse product of the feature matrix with the n-grams of the queries, followed by
+        the length penalty.
+
+        Args:
+            cols, queries, factors: as returned by _columns.
+            ls: array with the length of each query (must be > 0).
+
+        Return: query index, name index, probability. Only for the (query, name) pairs
+        sharing at least one n-gram (and not for the removed names, see remove_values).
+        '''
+        start = self.indptr[cols]
+        counts = self.indptr[cols + 1] - start
+        # position in self.indices of the names of each column, one after the other.
+        pos = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - start, counts)
+
+        n = len(self.l)
+        pairs, inv = np.unique(np.repeat(queries, counts) * n + self.indices[pos],
+                               return_inverse=True)
+        weights = self.weights[cols]
+        if factors is not None:
+            weights = weights * factors
+        ksum = np.bincount(inv, weights=np.repeat(weights, counts))
+        queries = pairs // n
+        names = pairs % n
+
+        if self.removed.any():
+            live = ~self.removed[names]
+            queries, names, ksum = queries[live], names[live], ksum[live]
+
+        if self.stats is not None:
+            self.stats.count('candidates', len(names))
+
+        ll = self.l[names] / ls[queries]
+        ll = np.where(ll > 1.0, 1.0 / ll, ll)
+        return queries, names, ksum / self.sumkVal[names] * ll
+
+    def _length(self, toTest):
+        '''
+        Default length of a vector: the size of its largest subset.
+        '''
+        if isinstance(toTest, dict):
+            return float(max(toTest.keys()))
+        return toTest[1]
+
     def get_Ps_vect(self, toTest, l=None):
         '''
         Get all the probabilities that the provided vector match with a words of self.values.
+
+        The vector is either a dict of subsets (get_subsets) or their keys (get_subset_keys).
+        Only the names sharing at least one n-gram with toTest are scored,
+        all the others have a probability of 0.
         '''
-        result = []
+        result = np.zeros(len(self.l))
         if l is None:
-            l = float(max(toTest.keys()))
-
-        for x in xrange(0, len(self.vector)):
-            newset = dict()
-            for k in self.vector[x]:
-                newset[k] = set(self.vector[x][k]).intersection(toTest[k])
-            ksum = self._sumk(newset)
-            if l > 0.0:
-                ll = self.l[x] / l
-                if ll > 1.0:
-                    ll = 1.0 / ll
-                result.append(ksum / self.sumkVal[x] * ll)
-            else:
-                result.append(0.0)
+            l = self._length(toTest)
+        if l > 0.0:
+            cols, queries, factors = self._columns([toTest])
+            queries, names, ps = self._product(cols, queries, np.array([l]), factors)
+            result[names] = ps
+
+        return result.tolist()
+
+    def best_Ps_vect(self, toTests, ls=None):
+        '''
+        Batched version of get_Ps_vect followed by np.argmax: all the vectors are scored in one
+        sparse product.
+
+        Args:
+            toTests: list of vectors (as returned by get_subsets or get_subset_keys)
+            ls: list of length of the vectors, by default the size of their largest subset.
+
+        Return: array of the best probability and array of the index of the best value for each vector.
+            (0.0 and the first name which is not removed when nothing match, see _first).
+        '''
+        if ls is None:
+            ls = [self._length(toTest) for toTest in toTests]
+        ls = np.array(ls, dtype=np.float64)
+
+        bestP = np.zeros(len(toTests))
+        bestIdx = np.zeros(len(toTests), dtype=np.int64) + self._first()
+
+        cols, queries, factors = self._columns(toTests)
+        keep = ls[queries] > 0.0
+        if factors is not None:
+            factors = factors[keep]
+        queries, names, ps = self._product(cols[keep], queries[keep], ls, factors)
+
+        # best probability of each query, the lowest index in case of equality (like np.argmax)
+        order = np.lexsort((names, -ps, queries))
+        first = order[np.concatenate(([True], queries[order][1:] != queries[order][:-1]))[:len(order)]]
+        bestP[queries[first]] = ps[first]
+        bestIdx[queries[first]] = names[first]
+
+        return bestP, bestIdx
+
+    def get_Ps(self, words):
+        '''
+        Get all the probabilities that the provided words match witch a words of the self.values.
+        '''
+        toTest, l = self.to_numberset(words)
+        return self.get_Ps_vect(toTest, l)
+
+    def get_alt(self, words):
+        '''
+        Provide all the alternative string to the provided one obtained by substitution of
+        word in self.synonymes
+        '''
+        return self._alternatives(self.clean_string(words))
+
+    def _alternatives(self, words):
+        '''
+        get_alt of a clean string. The synonyms found in the string are given by one search of
+        the regular expression of all the synonyms (see _synonymIndex).
+        '''
+        if self._synonymIndex is None:
+            first = defaultdict(list) # first character -> synonyms
+            empty = []
+            for sym in self.synonymes:
+                if len(sym[0]) > 0:
+                    first[sym[0][0]].append(sym)
+                else:
+                    empty.append(sym) # found everywhere
+            sources = sorted(set(sym[0] for sym in self.synonymes if len(sym[0]) > 0), key=len, reverse=True)
+            regex = re.compile('(?=' + '|'.join(re.escape(item) for item in sources) + ')' if sources else '(?!)')
+            self._synonymIndex = (regex, dict(first), empty)
+        regex, first, empty = self._synonymIndex
+
+        result = set((words,))
+        for sym in empty:
+            result.add(words.replace(sym[0], sym[1]))
+        # the regex gives the positions where a synonym start, the synonyms starting there are tested.
+        for m in regex.finditer(words):
+            x = m.start()
+            for sym in first[words[x]]:
+                if words.startswith(sym[0], x):
+                    result.add(words.replace(sym[0], sym[1]))
 
         return result
 
-    def get_Ps(self, words):
+    def _codes(self):
+        '''
+        Code column * number of names + name of each entry of the feature matrix (sorted, the
+        entries are sorted by column and name), built at the first use after each change of
+        the matrix.
+        '''
+        if self._entries is None:
+            counts = self.indptr[1:] - self.indptr[:-1]
+            self._entries = np.repeat(np.arange(len(self.keys), dtype=np.int64), counts) * len(self.l) + self.indices
+        return self._entries
+
+    def _probs(self, cols, factors, l, names):
+        '''
+        Exact probabilities that a vector match the names (array of index of the values).
+
+        Args:
+            cols, factors: columns of the n-grams of the vector and factors of their weights (see _columns).
+            l: length of the vector.
+        '''
+        codes = self._codes()
+        entries = (cols[:, np.newaxis] * len(self.l) + names[np.newaxis, :]).ravel()
+        pos = np.minimum(np.searchsorted(codes, entries), len(codes) - 1)
+        shared = (codes[pos] == entries).reshape(len(cols), len(names))
+        weights = self.weights[cols].astype(np.float64)
+        if factors is not None:
+            weights = weights * factors
+        ksum = weights.dot(shared) # (sums of small integers, or of their halves: exact)
+        ll = self.l[names].astype(np.float64) / l
+        ll = np.where(ll > 1.0, 1.0 / ll, ll)
+        return ksum / self.sumkVal[names] * ll
+
+    def _top_k(self, toTest, l, k, block=None):
+        '''
+        Get the k names that match the best the vector toTest (of length l).
+
+        The names sharing a word with toTest are sorted by an upper bound of their probability:
+        the length ratio times the largest intersection they can have with toTest (a name of
+        n words has at most n - k + 1 subsets of size k, and at most sumkVal), and the exact
+        probabilities are computed in that order (by growing batches, see _probs) until no name
+        left can beat the k-th best.
+
+        With block, only the names sharing one of the rarest words of toTest (whose names are at most
+        block entries of the feature matrix, at least the rarest word) are searched first. The
+        result is kept if the names sharing only the other words can not beat it (see _only_bound),
+        else all the names are searched: the result is the same, the names of the common words
+        (company, bank, plc...) are only read when they are needed.
+
+        Return: list of (probability, index of the value), best first, the lowest index first
+            in case of equality (like np.argmax).
+        '''
+        if l <= 0.0 or 1 not in toTest:
+            return []
+
+        cols, queries, factors = self._columns([{1: toTest[1]}])
+        # (the bound is still valid with corrected words, their factors are lower than 1)
+        vector = self._columns([toTest])
+        if block is not None and len(cols) > 1:
+            counts = self.indptr[cols + 1] - self.indptr[cols]
+            order = np.argsort(counts, kind='mergesort')
+            rare = max(1, np.searchsorted(np.cumsum(counts[order]), block, side='right'))
+            if rare < len(cols):
+                best = self._best(toTest, l, k, vector, cols[order[:rare]], len(cols) - rare)
+                if len(best) == k and best[-1][0] > self._only_bound(toTest, l, self.keys[cols[order[rare:]]]):
+                    return best
+        return self._best(toTest, l, k, vector, cols, 0)
+
+    def _best(self, toTest, l, k, vector, cols, other):
+        '''
+        The k best names among the names of the columns cols (of the words of toTest), see _top_k.
+
+        Args:
+            vector: columns, queries and factors of toTest (see _columns).
+            other: number of words of toTest not in cols (they could be shared by the names).
+        '''
+        start = self.indptr[cols]
+        counts = self.indptr[cols + 1] - start
+        pos = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - start, counts)
+        if len(pos) * 8 > len(self.l): # (a count per name is faster than a sort)
+            shared = np.bincount(self.indices[pos], minlength=len(self.l))
+            names = np.flatnonzero(shared)
+            shared = shared[names]
+        else:
+            names, shared = np.unique(self.indices[pos], return_counts=True)
+        live = ~self.removed[names]
+        names, shared = names[live], shared[live] + other
+
+        # upper bound of the k sum of the intersection, the shared subsets of size k are made of
+        # the shared words (exactly shared words if the words of the name are all different)
+        n = np.where(self.distinct[names], np.minimum(shared, self.l[names]), self.l[names])
+        kmax = shared.astype(np.float64)
+        for size in toTest:
+            if size > 1:
+                kmax += size ** 2.0 * np.minimum(len(toTest[size]), np.maximum(n - size + 1.0, 0.0))
+        ll = self.l[names].astype(np.float64) / l
+        ll = np.where(ll > 1.0, 1.0 / ll, ll)
+        bound = np.minimum(kmax, self.sumkVal[names]) / self.sumkVal[names] * ll
+
+        # the names are scored by batches of growing size, the best bounds first, until the bound of
+        # all the names left is lower than the k-th best probability.
+        pending = np.ones(len(names), dtype=bool)
+        bestP = np.zeros(0)
+        bestN = np.zeros(0, dtype=names.dtype)
+        step = 16
+        while True:
+            if len(bestP) == k:
+                pending &= bound >= bestP[-1]
+            batch = np.flatnonzero(pending)
+            if len(batch) == 0:
+                break
+            if len(batch) > step:
+                batch = batch[np.argpartition(-bound[batch], step - 1)[:step]]
+            pending[batch] = False
+            step *= 2
+            ps = self._probs(vector[0], vector[2], l, names[batch])
+            if self.stats is not None:
+                self.stats.count('candidates', len(batch))
+            bestP = np.concatenate((bestP, ps))
+            bestN = np.concatenate((bestN, names[batch]))
+            order = np.lexsort((bestN, -bestP))[:k]
+            bestP, bestN = bestP[order], bestN[order]
+
+        return zip(bestP.tolist(), bestN.tolist())
+
+    def _only_bound(self, toTest, l, common):
+        '''
+        Upper bound of the probability of the names sharing only the words of toTest whose
+        keys are in common (see _top_k).
+
+        The shared subsets are made of these words, so their k sum is at most kc, the k sum of
+        the subsets of toTest made of these words only. A name of n words has at least one subset
+        of each size, its sumkVal is at least 1 + 4 + ... + n ** 2, so its probability is at
+        most min(1, kc / (1 + ... + n ** 2)) * min(n / l, l / n).
+        '''
+        common = set(common.tolist())
+        words = set(gram[0] for gram in toTest[1] if _gram_key(gram) in common)
+        words.update(-2 - t for t in list(words) if t < -1) # corrected words
+        kc = sum(size ** 2.0 for size in toTest for gram in toTest[size] if all(t in words for t in gram))
+        if kc == 0.0:
+            return 0.0
+        n = np.arange(1.0, self.maxlen + 1.0)
+        return float((np.minimum(1.0, kc / (n * (n + 1.0) * (2.0 * n + 1.0) / 6.0)) * np.minimum(n / l, l / n)).max())
+
+    def top_k(self, words, k=3, block=300):
+        '''
+        Provide the k entries that match the closest (using the alternatives from self.synonymes,
+        as closerMatch)
+
+        Args:
+            words: the words to match.
+            k: number of entries to return.
+            block: see _top_k (None to search all the names sharing a word at once).
+
+        Return: list of (matching probability, matched value), best first.
+        '''
+        res = dict()
+        for w in self.get_alt(words):
+            toTest, l = self.to_numberset(w)
+            for p, idx in self._top_k(toTest, l, k, block):
+                if p > res.get(idx, -1.0):
+                    res[idx] = p
+
+        res = sorted(res.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+        return [(p, self.values[idx]) for idx, p in res]
+
+    def closerMatch(self, words, block=300):
+        '''
+        Provide the entry that match the closest
+
+        Args:
+            block: see _top_k (None to search all the names sharing a word at once).
+
+        Return: matching probability, matched value.
+        '''
+        return self._closer(self.clean_string(words), block)
+
+    def _first(self):
+        '''
+        Index of the value given when nothing match, as np.argmax on 0 probabilities: the first
+        name which is not removed (see remove_values).
+        '''
+        if len(self.removed) == 0 or not self.removed[0]:
+            return 0
+        live = np.flatnonzero(~self.removed)
+        return int(live[0]) if len(live) > 0 else 0
+
+    def _closer(self, words, block):
+        '''
+        closerMatch of a clean string.
+        '''
+        res = []
+        for w in self._alternatives(words):
+            toTest, l = self.to_numberset(w)
+            best = self._top_k(toTest, l, 1, block)
+            if len(best) > 0:
+                res.append((best[0][0], self.values[best[0][1]]))
+            else: # nothing match, as np.argmax on 0 probabilities.
+                res.append((0.0, self.values[self._first()]))
+
+        res = sorted(res, reverse=True)
+
+        return res[0]
+
+    def match_many(self, names, workers=None, block=300, chunk=500, cacheSize=1000000):
+        '''
+        closerMatch of many names (reconciliation of lists of names). The names are matched by
+        batches in parallel, each different clean name once (the results of cacheSize clean names
+        are kept, the cache is emptied when it is full).
+
+        Args:
+            names: iterable of names.
+            workers: number of processes, by default the number of cpu. 1 to run in this process.
+            block: see _top_k.
+            chunk: number of clean names sent at once to a process.
+            cacheSize: number of results kept.
+
+        Return: iterator of (name, matching probability, matched value), in the order of names.
+        '''
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        pool = None
+        if workers > 1:
+            pool = multiprocessing.Pool(workers, initializer=_init_matcher, initargs=(self, block))
+
+        done = dict() # clean name -> result
+        batch = []
+        try:
+            for item in itertools.chain(names, [None]):
+                if item is not None:
+                    batch.append(item)
+                    if len(batch) < chunk * workers:
+                        continue
+                if len(batch) == 0:
+                    break
+
+                keys = [self.clean_string(name) for name in batch]
+                todo = list(ordered_set.OrderedSet(key for key in keys if key not in done))
+                if len(done) + len(todo) > cacheSize:
+                    done.clear()
+                    todo = list(ordered_set.OrderedSet(keys))
+                if pool is None:
+                    results = [self._closer(key, block) for key in todo]
+                else:
+                    results = [r for part in pool.map(_match_worker, [todo[x:x + chunk] for x in
+                                                                     xrange(0, len(todo), chunk)])
+                               for r in part]
+                done.update(zip(todo, results))
+
+                for name, key in zip(batch, keys):
+                    yield (name,) + done[key]
+                batch = []
+        finally:
+            if pool is not None:
+                pool.terminate()
+
+    # arrays of a saved matcher
+    _arrays = ['l', 'sumkVal', 'tokens', 'offsets', 'keys', 'indptr', 'indices', 'weights', 'distinct',
+               'removed']
+
+    def save(self, filename):
+        '''
+        Save the object into the directory filename (created if needed): a header (header.json)
+        and flat numpy arrays (.npy) for the vocabulary, the names, their token ids and
+        the feature matrix. They are memory mapped by from_file.
+
+        Args:
+            filename: path to the directory to write in.
+        '''
+        arrays = dict((name, getattr(self, name)) for name in self._arrays)
+        header = {'synonymes': list(self.synonymes),
+                  'maxlen': self.maxlen,
+                  'version': self.version,
+                  'encodings': dict(),
+                  'typos': None}
+        if self.typos is not None: # the index is rebuilt by from_file
+            header['typos'] = {'maxDistance': self.typos.maxDistance, 'minLength': self.typos.minLength,
+                               'weight': self.typoWeight}
+        for name, strings in (('vocab', self.vocab), ('values', self.values)):
+            strings = stringarray.from_list(list(strings))
+            arrays[name] = strings.buf
+            arrays[name + '_offsets'] = strings.offsets
+            header['encodings'][name] = strings.encoding
+        _save_model(filename, 'matcher', header, arrays)
+
+    @classmethod
+    def from_file(cls, filename):
+        '''
+        Reopen a saved object. The arrays are memory mapped (read only), the pages are read
+        when they are used and shared between the processes.
+
+        Args:
+            filename: path to the directory written by save (or to a pickled object, also of the
+                older versions, see __setstate__).
+        '''
+        if not os.path.isdir(filename):
+            with open(filename, 'rb') as pkl_file:
+                return pickle.load(pkl_file)
+
+        header, arrays = _load_model(filename, 'matcher')
+        self = cls.__new__(cls)
+        for name in cls._arrays:
+            setattr(self, name, arrays[name])
+        self.vocab = stringarray(arrays['vocab'], arrays['vocab_offsets'], header['encodings']['vocab'])
+        self.values = stringarray(arrays['values'], arrays['values_offsets'], header['encodings']['values'])
+        self.synonymes = ordered_set.OrderedSet((_str(a), _str(b)) for a, b in header['synonymes'])
+        self.maxlen = header['maxlen']
+        self._Lookup = None
+        self.version = header['version']
+        if header.get('typos') is not None:
+            self.enable_typos(**header['typos'])
+            self.version = header['version']
+        return self
+
+
+class shardedmatcher(object):
+    '''
+    Matcher whose names are split in shards scored in parallel, in a pool of processes (for a
+    reference set too large to be scored quickly in one process).
+
+    The words are turned into token ids by the matcher given (its vocabulary, synonyms and typo
+    correction, see matcher.subset), so the shards give the same probabilities as the matcher.
+    The results of the shards are merged with the same order (the best probability, then the
+    lowest index): they are exactly the results of the matcher. The other attributes and methods
+    (values, clean_string, add_values, save...) are those of the matcher, the shards are cut again
+    when it changes (see matcher.version). It can be given to an extractor (best_Ps_vect), whose
+    own pools of processes must not be used then (workers=1).
+    '''
+
+    def __init__(self, match, shards=None, workers=None):
+        '''
+        Args:
+            match: the matcher (from_file maps its arrays: the pages read to cut the shards are
+                not kept in memory).
+            shards: number of shards, by default the number of cpu.
+            workers: number of processes, by default one per shard. 1 to score the shards in this process.
+        '''
+        if shards is None:
+            shards = multiprocessing.cpu_count()
+        self.matcher = match
+        self.nshards = shards
+        self.workers = min(shards, workers) if workers is not None else shards
+        self.pool = None
+        self.split()
+
+    def __getattr__(self, name):
+        # (the attributes which are not set are those of the matcher)
+        if name == 'matcher':
+            raise AttributeError(name)
+        return getattr(self.matcher, name)
+
+    def split(self):
+        '''
+        Cut the shards: consecutive names, with about the same number of entries of the feature
+        matrix (the work of a shard), and start the processes.
+
+        self.shards: matcher of each shard (see matcher.subset).
+        self.starts: index of the first name of each shard (and the number of names at the end).
+        '''
+        self.close()
+        m = self.matcher
+        entries = np.cumsum(np.bincount(m.indices, minlength=len(m.l)))
+        total = entries[-1] if len(entries) > 0 else 0
+        starts = [0] + [int(np.searchsorted(entries, total * x // self.nshards, side='right'))
+                        for x in xrange(1, self.nshards)] + [len(m.l)]
+        self.starts = np.maximum.accumulate(starts).tolist()
+        self.shards = [m.subset(self.starts[x], self.starts[x + 1]) for x in xrange(0, self.nshards)]
+        for shard in self.shards: # (built once, shared by the processes)
+            shard._codes()
+        self._version = m.version
+        if self.workers > 1:
+            self.pool = multiprocessing.Pool(self.workers, initializer=_init_shards, initargs=(self.shards,))
+
+    def close(self):
+        '''
+        Stop the processes.
+        '''
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool = None
+
+    def _map(self, name, args):
+        '''
+        Call the method name (see _shard_call) of each shard with args, in parallel.
+
+        Return: list of the results, one per shard.
+        '''
+        if self.matcher.version != self._version:
+            self.split()
+        if self.pool is None:
+            return [_shard_call(shard, name, args) for shard in self.shards]
+        return self.pool.map(_shard_worker, [(x, name, args) for x in xrange(0, len(self.shards))], chunksize=1)
+
+    def get_Ps_vect(self, toTest, l=None):
+        '''
+        See matcher.get_Ps_vect.
+        '''
+        if l is None:
+            l = self.matcher._length(toTest)
+        return [p for part in self._map('get_Ps_vect', (toTest, l)) for p in part]
+
+    def get_Ps(self, words):
+        '''
+        See matcher.get_Ps.
+        '''
+        toTest, l = self.matcher.to_numberset(words)
+        return self.get_Ps_vect(toTest, l)
+
+    def best_Ps_vect(self, toTests, ls=None):
+        '''
+        See matcher.best_Ps_vect.
+        '''
+        if ls is None:
+            ls = [self.matcher._length(toTest) for toTest in toTests]
+        bestP = np.zeros(len(toTests))
+        bestIdx = np.zeros(len(toTests), dtype=np.int64) + self.matcher._first()
+        # (the first shard, the lowest index, is kept in case of equality)
+        for start, (ps, idx) in zip(self.starts, self._map('best_Ps_vect', (toTests, ls))):
+            better = ps > bestP
+            bestP[better] = ps[better]
+            bestIdx[better] = idx[better] + start
+        return bestP, bestIdx
+
+    def _top_many(self, queries, k, block):
         '''
-        Get all the probabilities that the provided words match witch a words of the self.values.
+        matcher._top_k of each (vector, length) of queries, merged over the shards.
         '''
-        result = []
-        toTest, l = self.to_numberset(words)
-        return self.get_Ps_vect(toTest, l)
+        results = [[] for q in queries]
+        for start, part in zip(self.starts, self._map('top_ks', (queries, k, block))):
+            for q in xrange(0, len(queries)):
+                results[q].extend((p, idx + start) for p, idx in part[q])
+        return [sorted(r, key=lambda item: (-item[0], item[1]))[:k] for r in results]
 
-    def get_alt(self, words):
+    def top_k(self, words, k=3, block=300):
         '''
-        Provide all the alternative string to the provided one obtained by substitution of
-        word in self.synonymes
+        See matcher.top_k.
         '''
-        words = self.clean_string(words)
+        queries = [self.matcher.to_numberset(w) for w in self.matcher.get_alt(words)]
+        res = dict()
+        for best in self._top_many(queries, k, block):
+            for p, idx in best:
+                if p > res.get(idx, -1.0):
+                    res[idx] = p
 
-        result = set((words,))
-        for sym in self.synonymes:
-            if sym[0] in words:
-                result.add(words.replace(sym[0], sym[1]))
+        res = sorted(res.items(), key=lambda item: (-item[1], item[0]))[:k]
 
-        return result
+        return [(p, self.matcher.values[idx]) for idx, p in res]
 
-    def closerMatch(self, words):
+    def closerMatch(self, words, block=300):
         '''
-        Provide the entry that match the closest
-
-        Return: matching probability, matched value.
+        See matcher.closerMatch.
         '''
-        res = []
-        for w in self.get_alt(words):
-            r = self.get_Ps(w)
-            idx = np.argmax(r)
-            res.append((r[idx], self.values[idx]))
+        return self._closer_many([self.matcher.clean_string(words)], block)[0]
 
-        res = sorted(res, reverse=True)
+    def _closer_many(self, keys, block):
+        '''
+        matcher._closer of a list of clean strings, with one call of the shards.
+        '''
+        queries = []
+        first = [] # first query of each key
+        for key in keys:
+            first.append(len(queries))
+            queries.extend(self.matcher.to_numberset(w) for w in self.matcher._alternatives(key))
+        first.append(len(queries))
+        bests = self._top_many(queries, 1, block)
 
-        return res[0]
+        result = []
+        for x in xrange(0, len(keys)):
+            res = []
+            for best in bests[first[x]:first[x + 1]]:
+                if len(best) > 0:
+                    res.append((best[0][0], self.matcher.values[best[0][1]]))
+                else: # nothing match, as np.argmax on 0 probabilities.
+                    res.append((0.0, self.matcher.values[self.matcher._first()]))
+            result.append(sorted(res, reverse=True)[0])
+        return result
 
-    def save(self, filename):
+    def match_many(self, names, block=300, chunk=500, cacheSize=1000000):
         '''
-        Save the object into the file
+        See matcher.match_many: the chunks of clean names are scored by all the shards at once.
 
-        Args:
-            filename: path to the file to write in.
+        Return: iterator of (name, matching probability, matched value), in the order of names.
         '''
-        with open(filename, 'wb') as output:
-            pickle.dump(self, output)
+        done = dict() # clean name -> result
+        batch = []
+        for item in itertools.chain(names, [None]):
+            if item is not None:
+                batch.append(item)
+                if len(batch) < chunk:
+                    continue
+            if len(batch) == 0:
+                break
 
-    @classmethod
-    def from_file(cls, filename):
+            keys = [self.matcher.clean_string(name) for name in batch]
+            todo = list(ordered_set.OrderedSet(key for key in keys if key not in done))
+            if len(done) + len(todo) > cacheSize:
+                done.clear()
+                todo = list(ordered_set.OrderedSet(keys))
+            done.update(zip(todo, self._closer_many(todo, block)))
+
+            for name, key in zip(batch, keys):
+                yield (name,) + done[key]
+            batch = []
+
+    def memory_usage(self):
         '''
-        Reopen a saved object
+        Memory (bytes) of the matcher and of each shard (see matcher.memory_usage, the shards share
+        the vocabulary of the matcher).
 
-        Args:
-            filename: path to the file to read
+        Return: OrderedDict with the total of the matcher, of each shard and the 'total'.
         '''
-        with open(filename, 'rb') as pkl_file:
-            return pickle.load(pkl_file)
+        result = OrderedDict()
+        result['matcher'] = self.matcher.memory_usage()['total']
+        for x in xrange(0, len(self.shards)):
+            usage = self.shards[x].memory_usage()
+            result['shard%d' % x] = usage['total'] - sum(usage.get(name, 0) for name in ('vocab', 'vocab_offsets',
+                                                                                      'Lookup', 'synonymes', 'typos'))
+        result['total'] = sum(result.values())
+        return result
 
 
 class extractor(object):
@@ -231,7 +1834,7 @@ class extractor(object):
     Defined an extractor to extract data from a text.
     '''
 
-    def __init__(self, matcher, beforFlag, afterFlag, removeFlag ,globalre=None,start=None):
+    def __init__(self, matcher, beforFlag, afterFlag, removeFlag ,globalre=None,start=None, cacheSize=100000):
         '''
         Create a new extractor model.
         Args:
@@ -243,6 +1846,8 @@ class extractor(object):
             globalre: list of global replacement, Allow to replace a given string everywhere in the text
              in a given string is found in the text. This may be usfull because some company specific location
              are not always close to where the issuer is matched. These are tuples: (what to match, what to replace, by what)
+            cacheSize: number of groups of words whose best match is kept between the texts (lrucache,
+             its hits and misses are counted in self.cache.hits and self.cache.misses)
         '''
         assert isinstance(start,str)
         if start is not None:
@@ -259,60 +1864,284 @@ class extractor(object):
             for item in globalre:
                 self.globalre.append((matcher.clean_string(item[0]),matcher.clean_string(item[1]),matcher.clean_string(item[2])))
 
-    def extract(self, txt):
+        self._compile()
+
+        # group of words -> (best probability, index of the best value)
+        self.cache = lrucache(cacheSize)
+        self._cacheFor = None # matcher (and its version) of the cached values
+
+    # timings and counters (see the class stats and enable_stats), None to not measure anything.
+    stats = None
+
+    def __getstate__(self):
+        # the cache and the stats are not saved.
+        state = self.__dict__.copy()
+        state['cache'] = lrucache(self.cache.size)
+        state['_cacheFor'] = None
+        state.pop('stats', None)
+        return state
+
+    def __setstate__(self, state):
+        # the automaton is compiled again (a pickle of an older version may not have it, or not
+        # in this form).
+        self.__dict__.update(state)
+        if 'cache' not in state:
+            self.cache = lrucache(100000)
+            self._cacheFor = None
+        self._compile()
+
+    def enable_stats(self, callback=None):
         '''
-        Extract the data from the text.
+        Measure the time and count the work of each stage of the extraction in this extractor and
+        its matcher (in this process only, not in the workers of extract_many).
 
         Args:
-            txt: the text from which the data should be extracted.
+            callback: function called with the record of each text and of each matching (see stats).
+
+        Return: the stats object.
+        '''
+        self.stats = stats(callback)
+        self.matcher.stats = self.stats
+        return self.stats
+
+    def disable_stats(self):
+        '''
+        Stop the measures (see enable_stats).
+        '''
+        self.stats = None
+        self.matcher.stats = None
+
+    def _compile(self):
+        '''
+        Compile the global replacements, the synonyms of the matcher and the flags into
+        one automaton. The patterns without any word (only stop words) are ignored.
+        '''
+        patterns = ordered_set.OrderedSet()
+
+        def add(item):
+            words = tuple(item.split())
+            if len(words) == 0:
+                return None
+            return patterns.add(words)
+
+        self._globalre = [(add(item[0]), add(item[1]), item[2].split()) for item in self.globalre]
+        self._synonymes = [(add(item[0]), item[1].split()) for item in self.matcher.synonymes]
+        self._flags = [(add(item), '-') for item in self.beforFlag]
+        self._flags += [(add(item), '+') for item in self.afterFlag]
+        self._flags += [(add(item), '*') for item in self.removeFlag]
+
+        self.automaton = automaton(patterns)
+
+        # to find quickly where the flags (and global replacement conditions) are in a raw text.
+        first = set(patterns[pid][0] for pid, flag in self._flags if pid is not None)
+        first.update(patterns[cond][0] for cond, src, by in self._globalre if cond is not None)
+        first = sorted(first, key=len, reverse=True)
+        self._flagre = re.compile('|'.join(re.escape(item) for item in first) or '(?!)')
+        self._flagLen = max([len(item) for item in first] + [0])
+
+    def get_groups(self, txt):
+        '''
+        Get the groups of words of interest of the text, the words close to the flags.
+
+        The synonyms are applied locally: for each synonym, the words around its occurrences
+        (from the group going on at the flag before, to the flag which takes the group of the
+        occurrence) are re-read with the synonym and their groups are added.
+
+        Args:
+            txt: the text from which the data should be extracted, or the list of its
+                clean words (see tokencache).
+
+        Return: set of (distance to the flag, tuple of token ids).
         '''
 
+        st = self.stats
+        if st is not None:
+            t = st.begin()
+            st.count('documents')
+            if not isinstance(txt, list):
+                st.count('characters', len(txt))
+
         # Pre-process the text.
-        txt = self.matcher.clean_string(txt)
+        if isinstance(txt, list):
+            words = txt
+        else:
+            words = self.matcher.clean_string(txt).split()
+
+        if st is None:
+            return self._groups(words, copy.deepcopy(self.start), set())
+
+        st.lap('clean', t)
+        group = self._groups(words, copy.deepcopy(self.start), set())
+        st.end('document')
+        return group
+
+    def _groups(self, words, v, triggered, hits=None):
+        '''
+        Get the groups of words of interest of a list of (clean) words, see get_groups.
+
+        Args:
+            words: list of words.
+            v: start of the simplified representation of the text (see _parse).
+            triggered: set of the index of the global replacements whose condition
+                has been found (updated).
+            hits: occurrences of the patterns in words (automaton.search), if already known.
+        '''
+        st = self.stats
+        if st is not None:
+            t = time.time()
+            st.count('words', len(words))
+
+        if hits is None:
+            hits = self.automaton.search(words)
+        patterns = self.automaton.patterns
 
         # global replace.
-        for item in self.globalre:
-            if item[0] in txt:
-                txt = txt.replace(item[1],item[2])
-        #print txt
+        for x in xrange(0, len(self._globalre)):
+            cond, src, by = self._globalre[x]
+            if x in triggered or cond is None or cond in hits:
+                triggered.add(x)
+                if src in hits:
+                    words = _replace(words, hits[src], len(patterns[src]), by)
+                    hits = self.automaton.search(words)
 
-        # First create a simplified representation of the text.
-        v = copy.deepcopy(self.start)
+        if st is not None:
+            t = st.lap('globalre', t)
+            st.count('words_expanded', len(words))
 
-        # Create alternative texts based on the synonyms
-        newtxt=set((txt,))
-        for item in self.matcher.synonymes:
-            newtxt.add(txt.replace(item[0], item[1]))
+        start = copy.deepcopy(v)
+        tokens, flags = self._mark(words, hits)
+        if st is not None:
+            t = st.lap('flags', t)
+            st.count('flags', len(flags))
+        group = self._parse(tokens, v)
+        if st is not None:
+            t = st.lap('parse', t)
 
-        txtc=''
-        for item in newtxt:
-            txtc+=item
+        # flags sorted by start and by end, and the before flags ('-') by start.
+        flags = sorted(flags)
+        starts = [item[0] for item in flags]
+        ends = sorted(item[1] for item in flags)
+        starts_by_end = [item[0] for item in sorted(flags, key=lambda item: item[1])]
+        before = [item for item in flags if item[2] == '-']
+        before_starts = [item[0] for item in before]
 
-        for item in self.beforFlag:
-            txtc = txtc.replace(item,' - '+item)
+        # alternative readings based on the synonyms
+        for src, by in self._synonymes:
+            if src not in hits:
+                continue
+            n = len(patterns[src])
+            lookup = self.matcher.Lookup
+            windows = []
+            for x in _matches(hits[src], n, lambda g: True):
+                # from the last flag before the occurrence to the first flag after it.
+                y = bisect.bisect_right(ends, x)
+                begin = starts_by_end[y - 1] if y > 0 else 0
+                # from the start of the group going on at this flag (the flags do not end a group).
+                while begin > 0 and words[begin - 1] in lookup:
+                    begin -= 1
+                y = bisect.bisect_left(starts, x + n)
+                end = flags[y][1] if y < len(flags) else len(words)
+                # up to the end of the group following the flag.
+                while end < len(words) and words[end] in lookup:
+                    end += 1
+                end = min(end + 1, len(words))
+                # and up to the before flag which takes the group of the occurrence: the first
+                # one after the word closing the group (see _parse).
+                close = x + n
+                while close < len(words) and words[close] in lookup:
+                    close += 1
+                y = bisect.bisect_right(before_starts, close)
+                if y < len(before):
+                    end = max(end, before[y][1])
+                if len(windows) > 0 and begin < windows[-1][1]:
+                    windows[-1][1] = max(end, windows[-1][1])
+                    windows[-1][2].append(x)
+                else:
+                    windows.append([begin, end, [x]])
 
-        for item in self.afterFlag:
-            txtc = txtc.replace(item,item+' + ')
+            for begin, end, occ in windows:
+                tmp = _replace(words[begin:end], [x - begin for x in occ], n, by)
+                if begin == 0:
+                    v = copy.deepcopy(start)
+                else:
+                    v = [-1]
+                group.update(self._parse(self._mark(tmp, self.automaton.search(tmp))[0], v))
+                if st is not None:
+                    st.count('synonym_windows')
+                    st.count('synonym_words', len(tmp))
 
-        for item in self.removeFlag:
-            txtc = txtc.replace(item, item + ' * ')
+        if st is not None:
+            st.lap('synonyms', t)
+            st.count('groups', len(group))
+            st.peak('largest_group', max([len(item[1]) for item in group] + [0]))
+        return group
 
-        txtc = re.sub('(-\s*){1,}', ' - ', txtc)
+    def _mark(self, words, hits):
+        '''
+        Insert the flags in the words.
 
-        # tokenize the text with n-grams...
-        txtc = txtc.split()
-        #print txtc
-        #print '======================================'
+        Args:
+            words: list of words.
+            hits: occurrences of the patterns in words (automaton.search).
+
+        Return: list of words and flags ('-' before a beforFlag, '+' after an afterFlag,
+            '*' after a removeFlag), list of (start, end, flag) of the flags in words.
+        '''
+        # gap x (before word x) -> flags inserted in it.
+        marks = dict()
+        plain = lambda g: g not in marks
+        flags = []
+        for pid, flag in self._flags:
+            if pid in hits:
+                n = len(self.automaton.patterns[pid])
+                matches = _matches(hits[pid], n, plain)
+                flags.extend((x, x + n, flag) for x in matches)
+                for x in matches:
+                    if flag == '-':
+                        marks.setdefault(x, []).append(flag)
+                    else:
+                        marks.setdefault(x + n, []).insert(0, flag)
+
+        # consecutive - are merged.
+        tokens = []
+        prev = 0
+        for x in sorted(marks):
+            tokens.extend(words[prev:x])
+            for flag in marks[x]:
+                if not (flag == '-' and tokens[-1:] == ['-']):
+                    tokens.append(flag)
+            prev = x
+        tokens.extend(words[prev:])
+        return tokens, flags
+
+    def _parse(self, txtc, v):
+        '''
+        Get the groups of words close to the flags.
+
+        Args:
+            txtc: list of words and flags (see _mark)
+            v: start of the simplified representation of the text.
+
+        Return: set of (distance to the flag, tuple of token ids).
+        '''
+        # First create a simplified representation of the text.
         tmp = [] # for subset
-        for x in xrange(0, len(txtc)):
-            if txtc[x] in self.matcher.Lookup:
-                tmp.append(self.matcher.Lookup[txtc[x]])
+        get = self.matcher.Lookup.get
+        typos = self.matcher.typos
+        for w in txtc:
+            i = get(w)
+            if i is None and typos is not None: # corrected word (see matcher._tokens)
+                i = typos.correct(w)
+                if i is not None:
+                    i = -2 - i
+            if i is not None:
+                tmp.append(i)
             else: # not in a group
-                if txtc[x] in ['+', '*', '-']: # if we get a flag
-                    if txtc[x] == '-' and not isinstance(v[-1], int):
+                if w == '+' or w == '*' or w == '-': # if we get a flag
+                    if w == '-' and not isinstance(v[-1], int):
                         v.append(0)
-                    v.append(txtc[x])
-                    if txtc[x] == '+':
+                    v.append(w)
+                    if w == '+':
                         v.append(0)
                 else:
                     if len(tmp) > 0:
@@ -323,6 +2152,9 @@ class extractor(object):
                         v[-1] -= 1
                     else:
                         v.append(-1) # if not add one.
+        if len(tmp) > 0: # group at the end of the text (or of the window)
+            v.append(tmp)
+            v.append(-1)
 
         #print v
         #print '======================================'
@@ -341,57 +2173,629 @@ class extractor(object):
                     group.add((abs(v[x + 1]), tuple(v[x + 2])))
                 else:
                     if isinstance(v[x + 2], int):
-                        group.add((abs(v[x + 2]), tuple(v[x + 3])))
+                        # the group after the one following the flag, or this one if it is the last
+                        # (as the copy of the text read next with the synonyms before local readings)
+                        group.add((abs(v[x + 2]), tuple(v[x + 3] if x + 3 < len(v) else v[x + 1])))
                     else:
                         group.add((0, tuple(v[x + 2])))
             x += 1
 
-        #print group
-        #print '======================================'
+        return group
+
+    def extract(self, txt, scores=False):
+        '''
+        Extract the data from the text.
+
+        Args:
+            txt: the text from which the data should be extracted.
+            scores: if True, return (value, score, margin) (see extract_batch).
+        '''
+        return self.extract_batch([txt], scores)[0]
+
+    def extract_batch(self, txts, scores=False):
+        '''
+        Extract the data from several texts. The groups of words of all the texts are
+        matched at once (one sparse product in matcher.best_Ps_vect).
+
+        Args:
+            txts: list of texts from which the data should be extracted.
+            scores: if True, return (value, score, margin): the score of the extracted value and
+                its margin over the best other value (see _select, None if nothing is found).
+
+        Return: list with the value extracted from each text (None if nothing is found).
+        '''
+        result = self._select([self.get_groups(txt) for txt in txts])
+        if scores:
+            return result
+        return [item[0] for item in result]
+
+    def cascade(self, texts, minScore=None, minMargin=0.0):
+        '''
+        Extract the data from the first texts of a list (the documents of an isin, the txt version
+        of a document before its html version, ...): the texts are extracted one by one until a
+        value is confident enough, the next ones are not read.
+
+        Args:
+            texts: iterable of texts (a generator reading the files only when they are needed).
+            minScore: minimum score of a value to stop, None to stop at the first value found.
+            minMargin: minimum margin of a value over the best other value to stop (see _select).
+
+        Return: value, score, margin, index of the text of the value. The value with the best score
+            is returned if none is confident enough ((None, None, None, None) if nothing is found).
+        '''
+        best = (None, None, None, None)
+        for x, txt in enumerate(texts):
+            value, score, margin = self.extract(txt, scores=True)
+            if value is None:
+                continue
+            if best[0] is None or score > best[1]:
+                best = (value, score, margin, x)
+            if minScore is None or (score >= minScore and margin >= minMargin):
+                return value, score, margin, x
+        return best
+
+    def extract_stream(self, fileobj, window=1000, chunk=1048576):
+        '''
+        Extract the data from a file object (or a mmap, see txt_processing.open_text) read by chunks.
+
+        Only the text around the flags and the conditions of the global replacements, window
+        characters before and after them, is cleaned and parsed: the groups further than that
+        from a flag are ignored and a global replacement only apply from where its condition
+        is found.
+
+        Args:
+            fileobj: object with a read method. str are decoded as ascii (like txt_processing.get_text)
+            window: number of characters kept before and after a flag.
+            chunk: number of characters read at once.
+
+        Return: the extracted value (None if nothing is found).
+        '''
+        st = self.stats
+        if st is not None:
+            st.begin()
+            st.count('documents')
+        group = set()
+        triggered = set()
+        buf = u''  # text not parsed yet
+        offset = 0  # position of buf in the text
+        scanned = 0  # the flags starting before this position have been found
+        pending = []  # windows [start, end) to parse
+        if len(self.start) > 0: # the start of the text is like after a flag
+            pending.append([0, window])
+        eof = False
+        while not eof:
+            data = fileobj.read(chunk)
+            eof = len(data) == 0
+            if isinstance(data, str):
+                data = data.decode('ascii', errors='ignore')
+            buf += data
+
+            # find the flags (a flag can only be found when its longest word is fully read)
+            limit = offset + len(buf)
+            if not eof:
+                limit -= self._flagLen
+            for m in self._flagre.finditer(buf.lower(), scanned - offset):
+                if m.start() + offset >= limit:
+                    break
+                begin = m.start() + offset - window
+                end = m.end() + offset + window
+                if len(pending) > 0 and begin < pending[-1][1]:
+                    pending[-1][1] = max(pending[-1][1], end)
+                else:
+                    pending.append([max(begin, 0), end])
+            scanned = max(scanned, limit)
+
+            # parse the windows which are fully read and can not grow anymore.
+            while len(pending) > 0 and (eof or ((len(pending) > 1 or pending[0][1] <= scanned - window)
+                                               and pending[0][1] <= offset + len(buf))):
+                begin, end = pending.pop(0)
+                txt = buf[begin - offset:end - offset]
+                if begin > 0: # do not start or end in the middle of a word
+                    txt = _firstSpace.split(txt, 1)[-1]
+                if end < offset + len(buf) or not eof:
+                    txt = _lastSpace.split(txt, 1)[0]
+                if begin == 0:
+                    v = copy.deepcopy(self.start)
+                else:
+                    v = [-1]
+                if st is not None:
+                    t = time.time()
+                    st.count('characters', len(txt))
+                words = self.matcher.clean_string(txt).split()
+                if st is not None:
+                    st.lap('clean', t)
+                group.update(self._groups(words, v, triggered))
+
+            # forget the text which will not be used anymore.
+            keep = scanned - window
+            if len(pending) > 0:
+                keep = min(keep, pending[0][0])
+            if keep > offset:
+                buf = buf[keep - offset:]
+                offset = keep
+
+        if st is not None:
+            st.end('document')
+        return self._select([group])[0][0]
+
+    def _select(self, groups):
+        '''
+        Match the groups of words of several texts and select the best match of each text.
+
+        Args:
+            groups: list of set of groups (see get_groups), one per text.
+
+        Return: list with the value extracted from each text, its score and the difference with the
+            score of the best other value (its score if there is no other value), (None, None, None)
+            if there is no group.
+        '''
+
+        st = self.stats
+        if st is not None:
+            t = st.begin()
+
+        if self._cacheFor != (id(self.matcher), self.matcher.version):
+            self.cache.clear()
+            self._cacheFor = (id(self.matcher), self.matcher.version)
 
         # now we match each of these group with the matcher and get probability values
-        r = []
-        x = 0
-        for item in group:
-            subset = self.matcher.get_subsets(item[1])
-            ps = self.matcher.get_Ps_vect(subset)
-            idx = np.argmax(ps)
-            # print x,fcomp.values[idx], ps[idx]/float(item[0]+1)*len(fcomp.values[idx].split()),item[0]
-            x += 1
-            # (probability of being good, value matched)
-            # being good = match probability / distance with the flag * length of the matched string
-            # what we look must be close to the flag, and as long a possible.
-            r.append((ps[idx] / float(item[0] + 1) * len(self.matcher.values[idx].split()), self.matcher.values[idx]))
+        best = dict()
+        words = []
+        for item in set(item[1] for group in groups for item in group):
+            r = self.cache.get(item)
+            if r is None:
+                words.append(item)
+            else:
+                best[item] = r
+        if st is not None:
+            t = st.lap('cache', t)
+            st.count('cache_hits', len(best))
+            st.count('cache_misses', len(words))
+        bestP, bestIdx = self.matcher.best_Ps_vect([self.matcher.get_subset_keys(item) for item in words])
+        for x in xrange(0, len(words)):
+            best[words[x]] = (bestP[x], bestIdx[x])
+            self.cache[words[x]] = best[words[x]]
+        if st is not None:
+            t = st.lap('score', t)
 
-        # sort all the results
-        #print r
-        r = sorted(r, key=lambda x: x[0], reverse=True)
+        result = []
+        for group in groups:
+            r = []
+            for item in group:
+                p, idx = best[item[1]]
+                # (probability of being good, value matched)
+                # being good = match probability / distance with the flag * length of the matched string
+                # what we look must be close to the flag, and as long a possible.
+                r.append((p / float(item[0] + 1) * len(self.matcher.values[idx].split()), self.matcher.values[idx]))
 
-        #print r
-        #print '======================================'
-        # get the best match.
-        if len(r) > 0:
-            return r[0][1]
-        else:
-            return None
+            # sort all the results (the ties by value, to not depend on the order of the set)
+            r = sorted(r, key=lambda x: (-x[0], x[1]))
+
+            # get the best match.
+            if len(r) > 0:
+                second = 0.0 # score of the runner-up
+                for p, value in r:
+                    if value != r[0][1]:
+                        second = p
+                        break
+                result.append((r[0][1], float(r[0][0]), float(r[0][0] - second)))
+            else:
+                result.append((None, None, None))
+
+        if st is not None:
+            st.lap('select', t)
+            st.end('select')
+        return result
+
+    def extract_many(self, paths, workers=None, reader=None):
+        '''
+        Extract the data from many files in parallel.
+
+        The extractor is given once to each worker process (shared copy-on-write when the
+        processes are forked) and the files are sent one by one to the first free worker,
+        so a large file does not hold the others.
+
+        Args:
+            paths: iterable of paths to the files.
+            workers: number of processes, by default the number of cpu. 1 to run in this process.
+            reader: function returning the text of a file (or its clean words, see tokencache.read)
+                from its path, by default the file is read and decoded as ascii (as
+                txt_processing.get_text with raw=True)
+
+        Return: iterator of (path, extracted value), in the order they are done.
+        '''
+        if reader is None:
+            reader = _read_text
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+
+        if workers == 1:
+            for path in paths:
+                yield path, self.extract(reader(path))
+            return
+
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(self, reader))
+        try:
+            for result in pool.imap_unordered(_extract_worker, paths, chunksize=1):
+                yield result
+        finally:
+            pool.terminate()
 
     def save(self, filename):
         '''
-        Save the object into the file
+        Save the object into the directory filename (created if needed): the flags in
+        header.json and the matcher in the sub directory matcher (see matcher.save).
+
+        Args:
+            filename: path to the directory to write in.
+        '''
+        header = {'start': self.start,
+                  'beforFlag': self.beforFlag,
+                  'afterFlag': self.afterFlag,
+                  'removeFlag': self.removeFlag,
+                  'globalre': self.globalre,
+                  'cacheSize': self.cache.size}
+        _save_model(filename, 'extractor', header, dict())
+        self.matcher.save(os.path.join(filename, 'matcher'))
+
+    @classmethod
+    def from_file(cls, filename):
+        '''
+        Reopen a saved object (its matcher is memory mapped, see matcher.from_file)
+
+        Args:
+            filename: path to the directory written by save (or to a pickled object, also of the
+                older versions, see __setstate__).
+        '''
+        if not os.path.isdir(filename):
+            with open(filename, 'rb') as pkl_file:
+                return pickle.load(pkl_file)
+
+        header, arrays = _load_model(filename, 'extractor')
+        self = cls.__new__(cls)
+        self.matcher = matcher.from_file(os.path.join(filename, 'matcher'))
+        self.start = [_str(item) for item in header['start']]
+        self.beforFlag = [_str(item) for item in header['beforFlag']]
+        self.afterFlag = [_str(item) for item in header['afterFlag']]
+        self.removeFlag = [_str(item) for item in header['removeFlag']]
+        self.globalre = [tuple(_str(s) for s in item) for item in header['globalre']]
+        self._compile()
+        self.cache = lrucache(header['cacheSize'])
+        self._cacheFor = None
+        return self
+
+
+class multiextractor(object):
+    '''
+    Extract several fields (issuer, guarantor, ...) from the same texts. Each text is cleaned
+    and searched for the flags, global replacements and synonyms of all the fields once (one
+    automaton of all their patterns), then only the parsing and the matching are done per field,
+    with its own extractor.
+    '''
+
+    def __init__(self, extractors):
+        '''
+        Args:
+            extractors: list of (name of the field, extractor), or dict name -> extractor.
+        '''
+        if isinstance(extractors, dict):
+            extractors = sorted(extractors.items())
+        self.extractors = OrderedDict(extractors)
+        self._compile()
+
+    def _compile(self):
+        '''
+        Compile the patterns of all the extractors into one automaton, and for each extractor
+        the index in it of each of its patterns.
+        '''
+        patterns = ordered_set.OrderedSet()
+        self._index = []
+        for name in self.extractors:
+            self._index.append([patterns.add(item) for item in self.extractors[name].automaton.patterns])
+        self.automaton = automaton(patterns)
+
+    def get_groups(self, txt):
+        '''
+        Get the groups of words of interest of the text for each field (see extractor.get_groups).
+
+        Args:
+            txt: the text from which the data should be extracted, or the list of its
+                clean words (see tokencache).
+
+        Return: dict name of the field -> set of (distance to the flag, tuple of token ids).
+        '''
+        # the stats of each extractor measure the text as in extractor.get_groups.
+        timed = []
+        for e in self.extractors.values():
+            st = e.stats
+            if st is not None:
+                timed.append((st, st.begin()))
+                st.count('documents')
+                if not isinstance(txt, list):
+                    st.count('characters', len(txt))
+
+        if isinstance(txt, list):
+            words = txt
+        else:
+            words = self.extractors.values()[0].matcher.clean_string(txt).split()
+        for st, t in timed:
+            st.lap('clean', t)
+        hits = self.automaton.search(words)
+
+        result = dict()
+        for name, index in zip(self.extractors, self._index):
+            e = self.extractors[name]
+            # occurrences of the patterns of the field.
+            h = dict()
+            for pid in xrange(0, len(index)):
+                if index[pid] in hits:
+                    h[pid] = hits[index[pid]]
+            result[name] = e._groups(words, copy.deepcopy(e.start), set(), h)
+        for st, t in timed:
+            st.end('document')
+        return result
+
+    def extract(self, txt):
+        '''
+        Extract all the fields from the text.
+
+        Return: dict name of the field -> extracted value (None if nothing is found).
+        '''
+        return self.extract_batch([txt])[0]
+
+    def extract_batch(self, txts, scores=False):
+        '''
+        Extract all the fields from several texts (see extractor.extract_batch).
 
         Args:
-            filename: path to the file to write in.
+            txts: list of texts from which the data should be extracted.
+            scores: if True, the values are (value, score, margin).
+
+        Return: list of dict name of the field -> extracted value, one per text.
+        '''
+        groups = [self.get_groups(txt) for txt in txts]
+        result = [dict() for txt in txts]
+        for name in self.extractors:
+            values = self.extractors[name]._select([group[name] for group in groups])
+            for x in xrange(0, len(txts)):
+                result[x][name] = values[x] if scores else values[x][0]
+        return result
+
+    def save(self, filename):
         '''
-        with open(filename, 'wb') as output:
-            pickle.dump(self, output)
+        Save the object into the directory filename: the names of the fields in header.json and
+        each extractor in a sub directory (see extractor.save).
+        '''
+        _save_model(filename, 'multiextractor', {'fields': list(self.extractors)}, dict())
+        for x, name in enumerate(self.extractors):
+            self.extractors[name].save(os.path.join(filename, 'field%d' % x))
 
     @classmethod
     def from_file(cls, filename):
         '''
-        Reopen a saved object
+        Reopen a saved object (see extractor.from_file).
+        '''
+        header, arrays = _load_model(filename, 'multiextractor')
+        return cls([(_str(name), extractor.from_file(os.path.join(filename, 'field%d' % x)))
+                    for x, name in enumerate(header['fields'])])
 
+
+class tokencache(object):
+    '''
+    On disk cache of the clean words of the texts (see extractor.get_groups), to skip the
+    decoding and the cleaning when the same documents are read again (with other flags
+    for example).
+
+    The words of a text are stored as an array of token ids (int32), the ids of the vocabulary
+    of the matcher for its words and -1 - x for the x-th other word, which are stored after.
+    The key of a text is the hash of its content, of the vocabulary and of the version
+    of the cleaning (CLEAN_VERSION). The least recently used entries are removed when the
+    cache is larger than maxSize.
+    '''
+
+    def __init__(self, folder, matcher, maxSize=2 ** 30):
+        '''
         Args:
-            filename: path to the file to read
+            folder: directory of the cache (created if needed).
+            matcher: the matcher whose vocabulary is used.
+            maxSize: maximum size of the cache (bytes).
+        '''
+        self.folder = folder
+        self.matcher = matcher
+        self.maxSize = maxSize
+        self.hits = 0
+        self.misses = 0
+        self._vocabFor = None # version of the matcher of the vocabulary below
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        self.size = sum(size for path, size, used in self._entries())
+
+    def _vocabulary(self):
+        '''
+        Vocabulary of the matcher (array of the words and lookup) and its fingerprint.
+        '''
+        if self._vocabFor != self.matcher.version:
+            vocab = list(self.matcher.vocab)
+            h = hashlib.sha1()
+            for w in vocab:
+                h.update(w.encode('utf-8') if isinstance(w, unicode) else w)
+                h.update('\n')
+            self._vocab = np.array(vocab, dtype=object)
+            self._fingerprint = h.hexdigest()
+            self._vocabFor = self.matcher.version
+        return self._vocab, self.matcher.Lookup, self._fingerprint
+
+    def _path(self, data):
+        '''
+        File of the entry of the content data.
+        '''
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        key = hashlib.sha1('%s\n%s\n%d\n' % (hashlib.sha1(data).hexdigest(),
+                                              self._vocabulary()[2], CLEAN_VERSION)).hexdigest()
+        return os.path.join(self.folder, key[:2], key[2:] + '.npy')
+
+    def _entries(self):
+        '''
+        Return: list of (path, size, last use) of the entries.
+        '''
+        result = []
+        for root, dirs, files in os.walk(self.folder):
+            for f in files:
+                if f.endswith('.npy'):
+                    st = os.stat(os.path.join(root, f))
+                    result.append((os.path.join(root, f), st.st_size, st.st_mtime))
+        return result
+
+    def words(self, txt):
+        '''
+        Get the clean words of a text, from the cache or by cleaning it (and caching them).
+        '''
+        return self._words(txt, lambda: txt)
+
+    def read(self, path):
+        '''
+        Get the clean words of a file, the file is decoded as ascii (as txt_processing.get_text
+        with raw=True) only if it is not in the cache. To use as reader of extractor.extract_many.
+        '''
+        with open(path, 'rb') as f:
+            data = f.read()
+        return self._words(data, lambda: data.decode('ascii', errors='ignore'))
+
+    def _words(self, data, text):
+        '''
+        Clean words of the content data, text returns the text to clean if not in the cache.
+        '''
+        vocab, lookup, fingerprint = self._vocabulary()
+        path = self._path(data)
+        try:
+            with open(path, 'rb') as f:
+                ids = np.load(f)
+                other = np.load(f).tostring().split()
+        except (IOError, ValueError, EOFError): # not in the cache (or damaged)
+            pass
+        else:
+            self.hits += 1
+            try:
+                os.utime(path, None) # used now (for the eviction)
+            except OSError:
+                pass
+            words = np.empty(len(ids), dtype=object)
+            known = ids >= 0
+            words[known] = vocab[ids[known]]
+            words[~known] = np.array(other, dtype=object)[-1 - ids[~known]]
+            return words.tolist()
+
+        self.misses += 1
+        words = self.matcher.clean_string(text()).split()
+        others = dict()
+        ids = np.array([lookup[w] if w in lookup else -1 - others.setdefault(w, len(others))
+                        for w in words], dtype=np.int32)
+        other = ' '.join(sorted(others, key=others.get))
+        if isinstance(other, unicode):
+            other = other.encode('ascii')
+        self._store(path, ids, np.frombuffer(other, dtype=np.uint8) if other else np.zeros(0, np.uint8))
+        return words
+
+    def _store(self, path, ids, other):
+        '''
+        Write an entry (atomically, several processes can share the cache) and remove the
+        least recently used entries if the cache is too large.
         '''
-        with open(filename, 'rb') as pkl_file:
-            return pickle.load(pkl_file)
+        if not os.path.isdir(os.path.dirname(path)):
+            try:
+                os.makedirs(os.path.dirname(path))
+            except OSError: # created by an other process
+                pass
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, ids)
+            np.save(f, other)
+        os.rename(tmp, path)
+        self.size += os.path.getsize(path)
+
+        if self.size > self.maxSize:
+            entries = sorted(self._entries(), key=lambda item: item[2])
+            self.size = sum(size for p, size, used in entries)
+            for p, size, used in entries:
+                if self.size <= self.maxSize * 0.9:
+                    break
+                try:
+                    os.remove(p)
+                except OSError:
+                    pass
+                self.size -= size
+
+    def clear(self):
+        '''
+        Remove all the entries.
+        '''
+        for p, size, used in self._entries():
+            os.remove(p)
+        self.size = 0
+
+
+def _read_text(path):
+    '''
+    Default reader of extractor.extract_many.
+    '''
+    with open(path, 'rb') as f:
+        return f.read().decode('ascii', errors='ignore')
+
+# matcher and block of a worker process of matcher.match_many
+_matcher = None
+
+def _init_matcher(m, block):
+    '''
+    Initialisation of a worker process of matcher.match_many.
+    '''
+    global _matcher
+    _matcher = (m, block)
+
+def _match_worker(keys):
+    '''
+    Task of a worker process of matcher.match_many.
+    '''
+    return [_matcher[0]._closer(key, _matcher[1]) for key in keys]
+
+# shards of a worker process of shardedmatcher
+_shards = None
+
+def _init_shards(shards):
+    '''
+    Initialisation of a worker process of shardedmatcher.
+    '''
+    global _shards
+    _shards = shards
+
+def _shard_call(shard, name, args):
+    '''
+    Call the method name of a shard, 'top_ks' for the _top_k of a list of (vector, length).
+    '''
+    if name == 'top_ks':
+        queries, k, block = args
+        return [shard._top_k(toTest, l, k, block) for toTest, l in queries]
+    return getattr(shard, name)(*args)
+
+def _shard_worker(task):
+    '''
+    Task of a worker process of shardedmatcher: (index of the shard, method, arguments).
+    '''
+    x, name, args = task
+    return _shard_call(_shards[x], name, args)
+
+# extractor and reader of a worker process of extractor.extract_many
+_worker = None
+
+def _init_worker(extract, reader):
+    '''
+    Initialisation of a worker process of extractor.extract_many.
+    '''
+    global _worker
+    _worker = (extract, reader)
+
+def _extract_worker(path):
+    '''
+    Task of a worker process of extractor.extract_many.
+    '''
+    return path, _worker[0].extract(_worker[1](path))
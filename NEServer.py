@@ -0,0 +1,309 @@
+#
+# Author: Albert de Jamblinne de Meux
+# thealbertsmail@gmail.com
+# All right reserved.
+#
+# Under Creative Commons Attribution-NonCommercial-ShareAlike 4.0 International Public License
+# Read the LICENSE.TXT for detail or https://creativecommons.org/licenses/by-nc-sa/4.0/legalcode
+#
+#
+# Extraction service: the extractor is loaded once and kept in memory, the requests received
+# at the same time are extracted together (extractor.extract_batch) in a pool of processes.
+#
+#   python NEServer.py extractor.model --port 8000 --workers 4
+#
+#   curl -d '{"text": "Issuer: Barclays Bank PLC"}' localhost:8000/extract
+#   curl -d '{"paths": ["/data/txt/1.txt", "/data/txt/2.txt"]}' localhost:8000/extract
+#   curl localhost:8000/status
+#
+import argparse
+import BaseHTTPServer
+import SocketServer
+import json
+import multiprocessing
+import Queue
+import threading
+import time
+
+import NEModel
+
+# extractor of a worker process
+_extract = None
+
+
+def _init_worker(extract):
+    '''
+    Initialisation of a worker process.
+    '''
+    global _extract
+    _extract = extract
+
+
+def _extract_items(extract, items):
+    '''
+    Extract the data of a list of items ('text', text) or ('path', path).
+
+    Return: list of ('ok', value) or ('error', message), one per item.
+    '''
+    result = [None] * len(items)
+    texts = []
+    index = []
+    for x in xrange(0, len(items)):
+        kind, value = items[x]
+        try:
+            texts.append(NEModel._read_text(value) if kind == 'path' else value)
+            index.append(x)
+        except (IOError, OSError) as err:
+            result[x] = ('error', str(err))
+
+    for x, value in zip(index, extract.extract_batch(texts)):
+        result[x] = ('ok', value)
+    return result
+
+
+def _safe_extract(extract, items):
+    '''
+    _extract_items, an error is given to all the items if the extraction fails (the requests do
+    not wait for ever, and the batcher thread goes on).
+    '''
+    try:
+        return _extract_items(extract, items)
+    except Exception as err:
+        return [('error', '%s: %s' % (type(err).__name__, err))] * len(items)
+
+
+def _worker(items):
+    '''
+    Task of a worker process.
+    '''
+    return _safe_extract(_extract, items)
+
+
+class batcher(object):
+    '''
+    Group the items submitted at the same time by several threads into batches: a batch is
+    started maxWait seconds after its first item (at once if maxBatch items are waiting). Each batch
+    is split between the worker processes, which have their own copy of the extractor.
+
+    The items of a chunk whose worker fails (killed process, result which can not be pickled) or
+    does not answer within timeout seconds get an error.
+    '''
+
+    def __init__(self, extract, workers=None, maxBatch=64, maxWait=0.005, timeout=60.0):
+        '''
+        Args:
+            extract: the extractor.
+            workers: number of processes, by default the number of cpu. 1 to extract in this process.
+            maxBatch: maximum number of items of a batch.
+            maxWait: maximum time (seconds) an item waits for the others.
+            timeout: maximum time (seconds) a chunk waits for its worker.
+        '''
+        if workers is None:
+            workers = multiprocessing.cpu_count()
+        self.extract = extract
+        self.workers = workers
+        self.maxBatch = maxBatch
+        self.maxWait = maxWait
+        self.timeout = timeout
+        self.queue = Queue.Queue()
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+
+        self.pool = None
+        if workers > 1:
+            self.pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(extract,))
+            # chunks sent to the workers, checked by the collector thread.
+            self.pending = Queue.Queue()
+            collector = threading.Thread(target=self._collect)
+            collector.daemon = True
+            collector.start()
+        self.thread = threading.Thread(target=self._run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, items):
+        '''
+        Extract the data of items (see _extract_items) and wait for the result.
+        '''
+        if len(items) == 0:
+            return []
+        request = {'items': items, 'result': [None] * len(items), 'todo': len(items),
+                   'done': threading.Event()}
+        for x in xrange(0, len(items)):
+            self.queue.put((request, x))
+        request['done'].wait()
+        return request['result']
+
+    def _run(self):
+        '''
+        Make the batches (thread).
+        '''
+        while True:
+            batch = [self.queue.get()]
+            # (a get with a timeout polls the queue with sleeps up to 50 ms in python 2)
+            if self.maxWait > 0 and self.queue.qsize() < self.maxBatch - 1:
+                time.sleep(self.maxWait)
+            while len(batch) < self.maxBatch:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except Queue.Empty:
+                    break
+            self.batches += 1
+            self.items += len(batch)
+
+            if self.pool is None:
+                self._done(batch, _safe_extract(self.extract, [r['items'][x] for r, x in batch]))
+                continue
+
+            # one chunk per worker.
+            size = (len(batch) + self.workers - 1) // self.workers
+            for y in xrange(0, len(batch), size):
+                chunk = batch[y:y + size]
+                task = self.pool.apply_async(_worker, ([r['items'][x] for r, x in chunk],),
+                                             callback=lambda result, chunk=chunk: self._done(chunk, result))
+                self.pending.put((chunk, task, time.time() + self.timeout))
+
+    def _collect(self):
+        '''
+        Give an error to the chunks whose worker failed or timed out (thread). The results are
+        given by the callbacks, which are called only on success.
+        '''
+        while True:
+            chunk, task, deadline = self.pending.get()
+            task.wait(max(deadline - time.time(), 0.0))
+            if not task.ready():
+                error = 'timeout: no result from the worker after %g s' % self.timeout
+            elif not task.successful():
+                try:
+                    task.get(0)
+                except Exception as err:
+                    error = '%s: %s' % (type(err).__name__, err)
+            else:
+                continue
+            self.errors += 1
+            self._done(chunk, [('error', error)] * len(chunk))
+
+    def _done(self, chunk, result):
+        '''
+        Give the results to the requests (only once per chunk: a late result of a timed out
+        chunk is dropped).
+        '''
+        with self.lock:
+            request, x = chunk[0]
+            if request['result'][x] is not None:
+                return
+            for (request, x), value in zip(chunk, result):
+                request['result'][x] = value
+                request['todo'] -= 1
+                if request['todo'] == 0:
+                    request['done'].set()
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.terminate()
+
+
+class handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    '''
+    POST /extract with a json object: {"text": ...}, {"path": ...}, {"texts": [...]} or {"paths": [...]}
+    answer {"result": value} (or {"results": [...]}), a value is null if nothing is found and
+    {"error": message} if the file can not be read or the extraction fails. GET /status give the
+    counters of the server.
+    '''
+    # the answer is buffered and sent at once (with a write for the headers and an other one for
+    # the body, the delayed ack of the client add 40 ms).
+    wbufsize = -1
+
+    def _send(self, code, data):
+        body = json.dumps(data)
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != '/status':
+            return self._send(404, {'error': 'unknown path'})
+        b = self.server.batcher
+        self._send(200, {'status': 'ok', 'workers': b.workers, 'batches': b.batches, 'items': b.items,
+                         'failed_chunks': b.errors, 'uptime_s': time.time() - self.server.started})
+
+    def do_POST(self):
+        if self.path != '/extract':
+            return self._send(404, {'error': 'unknown path'})
+        t = time.time()
+        try:
+            data = json.loads(self.rfile.read(int(self.headers.getheader('Content-Length', 0))))
+            many = 'texts' in data or 'paths' in data
+            if 'texts' in data or 'text' in data:
+                items = [('text', item) for item in data.get('texts', [data.get('text')])]
+            else:
+                items = [('path', item) for item in data.get('paths', [data.get('path')])]
+            if any(not isinstance(value, basestring) for kind, value in items):
+                raise ValueError('text or path expected')
+        except (ValueError, AttributeError, TypeError) as err:
+            return self._send(400, {'error': 'bad request: %s' % err})
+
+        results = [{'result': value} if status == 'ok' else {'error': value}
+                   for status, value in self.server.batcher.submit(items)]
+        ms = (time.time() - t) * 1000.0
+        if many:
+            self._send(200, {'results': results, 'ms': ms})
+        else:
+            self._send(200, dict(results[0], ms=ms))
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+class server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    '''
+    HTTP server of an extractor, one thread per connection (see handler and batcher).
+    '''
+    daemon_threads = True
+    request_queue_size = 128 # connections waiting to be accepted.
+
+    def __init__(self, extract, host='127.0.0.1', port=8000, workers=None, maxBatch=64, maxWait=0.005,
+                 verbose=False, timeout=60.0):
+        BaseHTTPServer.HTTPServer.__init__(self, (host, port), handler)
+        self.batcher = batcher(extract, workers, maxBatch, maxWait, timeout)
+        self.started = time.time()
+        self.verbose = verbose
+
+    def server_close(self):
+        BaseHTTPServer.HTTPServer.server_close(self)
+        self.batcher.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Extraction service (see NEServer.handler).')
+    parser.add_argument('model', help='saved extractor (see NEModel.extractor.save)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=None, help='number of processes')
+    parser.add_argument('--max-batch', type=int, default=64, help='maximum number of texts per batch')
+    parser.add_argument('--max-wait', type=float, default=5.0,
+                        help='maximum time (ms) a text waits for the others')
+    parser.add_argument('--timeout', type=float, default=60.0,
+                        help='maximum time (s) to wait for a worker, then the texts get an error')
+    parser.add_argument('--verbose', action='store_true', help='log the requests')
+    args = parser.parse_args(argv)
+
+    extract = NEModel.extractor.from_file(args.model)
+    s = server(extract, args.host, args.port, args.workers, args.max_batch, args.max_wait / 1000.0,
+               args.verbose, args.timeout)
+    print 'serving %s on http://%s:%d' % (args.model, args.host, args.port)
+    try:
+        s.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        s.server_close()
+
+
+if __name__ == '__main__':
+    main()
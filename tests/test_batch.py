@@ -0,0 +1,71 @@
+#
+# Tests of Issuer_extraction/batch:
+#
+#   python -m unittest discover tests
+#
+import csv
+import json
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'Issuer_extraction'))
+import batch
+import NEModel
+
+
+class accents(unittest.TestCase):
+    '''
+    Values with accents, in utf-8 or in latin-1 byte strings, go to the output and to the csv.
+    '''
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        values = ['Soci\xc3\xa9t\xc3\xa9 G\xc3\xa9n\xc3\xa9rale SA', # utf-8
+                  'Cr\xe9dit Agricole SA', # latin-1
+                  'Barclays Bank PLC']
+        m = NEModel.matcher(values, [])
+        self.e = NEModel.extractor(m, ['issue'], ['issuer'], ['guarantor'], start='+')
+        self.records = []
+        for isin, txt in [('XS1', 'Issuer: Societe Generale SA'), ('XS2', 'Issuer: Credit Agricole SA'),
+                          ('XS3', 'Issuer: Barclays Bank PLC'), ('XS4', 'nothing here')]:
+            path = os.path.join(self.folder, isin + '.txt')
+            with open(path, 'w') as f:
+                f.write(txt)
+            self.records.append({'isin': isin, 'paths': [path]})
+        self.output = os.path.join(self.folder, 'output.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_run(self):
+        self.assertEqual(batch.run(self.e, self.records, self.output, workers=1), 4)
+        with open(self.output, 'rb') as f:
+            values = dict((record['isin'], record['value']) for record in batch.read_records(f))
+        self.assertEqual(values, {'XS1': u'Soci\xe9t\xe9 G\xe9n\xe9rale SA', 'XS2': u'Cr\xe9dit Agricole SA',
+                                  'XS3': u'Barclays Bank PLC', 'XS4': None})
+
+        filename = os.path.join(self.folder, 'output.csv')
+        batch.to_csv(self.output, filename)
+        with open(filename, 'rb') as f:
+            rows = dict(csv.reader(f))
+        self.assertEqual(rows, {'XS1': 'Soci\xc3\xa9t\xc3\xa9 G\xc3\xa9n\xc3\xa9rale SA',
+                                'XS2': 'Cr\xc3\xa9dit Agricole SA', 'XS3': 'Barclays Bank PLC', 'XS4': ''})
+
+    def test_to_csv(self):
+        with open(self.output, 'wb') as f:
+            f.write(json.dumps({'isin': u'XS1', 'value': u'Soci\xe9t\xe9 G\xe9n\xe9rale SA'}) + '\n')
+            f.write(json.dumps({'isin': u'XS2', 'value': None}) + '\n')
+        filename = os.path.join(self.folder, 'output.csv')
+        batch.to_csv(self.output, filename)
+        with open(filename, 'rb') as f:
+            rows = dict(csv.reader(f))
+        self.assertEqual(rows, {'XS1': 'Soci\xc3\xa9t\xc3\xa9 G\xc3\xa9n\xc3\xa9rale SA', 'XS2': ''})
+
+
+if __name__ == '__main__':
+    unittest.main()
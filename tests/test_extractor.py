@@ -0,0 +1,270 @@
+#
+# Tests of NEModel.extractor:
+#
+#   python -m unittest discover tests
+#
+import copy
+import os
+import random
+import shutil
+import StringIO
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import NEModel
+
+
+class last_group(unittest.TestCase):
+    '''
+    The group at the end of a text, or of a window of extract_stream, is parsed.
+    '''
+
+    def setUp(self):
+        m = NEModel.matcher(['Barclays Bank PLC', 'Deutsche Bank AG'], [('int', 'international')])
+        self.e = NEModel.extractor(m, ['issue'], ['issuer'], ['guarantor'], start='+')
+
+    def test_extract(self):
+        self.assertEqual(self.e.extract('Barclays int zz'), 'Barclays Bank PLC')
+        self.assertEqual(self.e.extract('int zz issuer Deutsche Bank AG'), 'Deutsche Bank AG')
+
+    def test_stream(self):
+        for txt, value in [('Barclays int zz', 'Barclays Bank PLC'),
+                           ('int zz issuer Deutsche Bank AG', 'Deutsche Bank AG')]:
+            self.assertEqual(self.e.extract_stream(StringIO.StringIO(txt), window=50, chunk=7), value)
+
+    def test_stream_window(self):
+        # the window of the flag ends in the word after the group.
+        group = ' Deutsche Bank AG '
+        txt = 'zz ' * 200 + 'issuer' + group + 'zz ' * 200
+        self.assertEqual(self.e.extract_stream(StringIO.StringIO(txt), window=len(group) + 1, chunk=64),
+                         'Deutsche Bank AG')
+
+    def test_no_synonym(self):
+        # a change from the first version, which ignored a group ending the text (no group was
+        # found here, and it gave the first value, 'Barclays Bank PLC').
+        m = NEModel.matcher(['Barclays Bank PLC', 'Deutsche Bank AG'], [])
+        e = NEModel.extractor(m, ['issue'], ['issuer'], ['guarantor'], start='+')
+        ids = tuple(m.Lookup[w] for w in ['deutsche', 'bank', 'ag'])
+        self.assertIn((0, ids), e.get_groups('Issuer: Deutsche Bank AG'))
+        self.assertEqual(e.extract('Issuer: Deutsche Bank AG'), 'Deutsche Bank AG')
+
+
+class synonym_windows(unittest.TestCase):
+    '''
+    The local synonym readings give the groups of the whole text read with the synonym.
+    '''
+
+    def reference(self, e, txt):
+        # the text, then the text with each synonym, read in full.
+        words = e.matcher.clean_string(txt).split()
+        synonymes = e._synonymes
+        e._synonymes = []
+        try:
+            hits = e.automaton.search(words)
+            result = e._groups(words, copy.deepcopy(e.start), set(), hits)
+            for src, by in synonymes:
+                if src in hits:
+                    n = len(e.automaton.patterns[src])
+                    occ = NEModel._matches(hits[src], n, lambda g: True)
+                    result |= e._groups(NEModel._replace(words, occ, n, by), copy.deepcopy(e.start), set())
+        finally:
+            e._synonymes = synonymes
+        return result
+
+    def test_before_flag(self):
+        # the group of the synonym is taken by the second before flag, after the word closing it.
+        m = NEModel.matcher(['delta north first', 'finance bank holding sa'], [('holding', 'delta')])
+        e = NEModel.extractor(m, ['issuer'], ['issue'], ['guarantor'], start='+')
+        groups = e.get_groups('holding issuer int issuer')
+        self.assertIn((2, (m.Lookup['delta'],)), groups)
+        self.assertEqual(groups, self.reference(e, 'holding issuer int issuer'))
+
+    def test_group_before_flag(self):
+        # the group of the synonym starts before the flag (a flag does not end a group).
+        m = NEModel.matcher(['delta north first', 'finance bank holding sa'], [('holding', 'delta')])
+        e = NEModel.extractor(m, ['issuer'], ['issue'], ['guarantor'], start='+')
+        for txt in ['zz finance bank issue holding zz', 'zz bank issue north holding issuer zz issuer zz']:
+            self.assertEqual(e.get_groups(txt), self.reference(e, txt))
+
+    def test_random(self):
+        rand = random.Random(0)
+        vocab = ['a1', 'b2', 'c3', 'd4', 'e5', 'issue', 'issuer', 'x', 'y', 'z', 'of', 'the']
+        m = NEModel.matcher(['a1 b2', 'b2 c3 d4', 'e5 a1', 'x y', 'c3 issue'], [('z', 'd4'), ('of the', 'e5')])
+        e = NEModel.extractor(m, ['issuer'], ['issue'], ['y'], start='+')
+        for x in xrange(0, 2000):
+            txt = ' '.join(rand.choice(vocab) for y in xrange(0, rand.randint(0, 30)))
+            self.assertEqual(e.get_groups(txt), self.reference(e, txt), txt)
+
+
+class repeated_words(unittest.TestCase):
+    '''
+    The groups with repeated words are scored as by closerMatch (the n-grams of get_subsets).
+    '''
+
+    def setUp(self):
+        self.m = NEModel.matcher(['capital capital', 'alpha capital beta gamma delta', 'x y x y x z', 'a b a b'], [])
+        self.e = NEModel.extractor(self.m, ['issue'], ['issuer'], ['guarantor'], start='+')
+
+    def test_extract(self):
+        for group in ['alpha capital alpha capital', 'capital alpha capital', 'x y x y', 'a b a b b', 'a x a x']:
+            txt = 'Issuer: %s zz' % group
+            p, value = self.m.closerMatch(group)
+            self.assertEqual(self.e.extract(txt, scores=True)[:2], (value, p * len(value.split())))
+        self.assertEqual(self.e.extract('Issuer: alpha capital alpha capital zz', scores=True)[:2],
+                         ('capital capital', 1.0))
+
+    def test_subset_keys(self):
+        rand = random.Random(0)
+        for x in xrange(0, 1000):
+            t = [rand.choice([0, 1, 2, 3, -1]) for y in xrange(0, rand.randint(1, 8))]
+            a = self.m.best_Ps_vect([self.m.get_subsets(t)])
+            b = self.m.best_Ps_vect([self.m.get_subset_keys(t)])
+            self.assertEqual((a[0].tolist(), a[1].tolist()), (b[0].tolist(), b[1].tolist()))
+
+
+class cache(unittest.TestCase):
+    '''
+    lrucache and the cache of the group matches of the extractor.
+    '''
+
+    def test_lrucache(self):
+        c = NEModel.lrucache(2)
+        c['a'] = 1
+        c['b'] = 2
+        self.assertEqual(c.get('a'), 1) # b is now the least recently used
+        c['c'] = 3
+        self.assertEqual((c.get('b'), c.get('c'), c.get('a'), c.get('d', 0)), (None, 3, 1, 0))
+        self.assertEqual((c.hits, c.misses, len(c)), (3, 2, 2))
+        c.clear()
+        self.assertEqual((c.get('a'), len(c)), (None, 0))
+
+    def test_extractor(self):
+        m = NEModel.matcher(['Barclays Bank PLC', 'Deutsche Bank AG'], [])
+        e = NEModel.extractor(m, ['issue'], ['issuer'], ['guarantor'], start='+')
+        txt = 'Issuer: Deutsche Bank AG zz Guarantor: Barclays Bank PLC zz'
+        groups = set(item[1] for item in e.get_groups(txt))
+        self.assertEqual(e.extract(txt), 'Deutsche Bank AG')
+        self.assertEqual((e.cache.hits, e.cache.misses), (0, len(groups)))
+        self.assertEqual(e.extract(txt), 'Deutsche Bank AG')
+        self.assertEqual((e.cache.hits, e.cache.misses), (len(groups), len(groups)))
+        # same values without the cache (one entry).
+        small = NEModel.extractor(m, ['issue'], ['issuer'], ['guarantor'], start='+', cacheSize=1)
+        texts = [txt, 'Issuer: Barclays zz', 'Issuer: Deutsche zz', txt]
+        self.assertEqual(small.extract_batch(texts, scores=True), e.extract_batch(texts, scores=True))
+
+        # emptied when the names change.
+        m.add_values(['Deutsche Bank AG London'])
+        self.assertEqual(e.extract('Issuer: Deutsche Bank AG London zz'), 'Deutsche Bank AG London')
+        self.assertEqual(len(e.cache), len(set(item[1] for item in e.get_groups('Issuer: Deutsche Bank AG London zz'))))
+
+
+class stats(unittest.TestCase):
+    '''
+    Counters and records of enable_stats.
+    '''
+
+    def test_counters(self):
+        m = NEModel.matcher(['Barclays Bank PLC', 'Deutsche Bank AG International'], [('int', 'international')])
+        e = NEModel.extractor(m, ['issue'], ['issuer'], ['guarantor'], start='+')
+        txt = 'The Issuer: Deutsche Bank AG int, Guarantor: Barclays Bank PLC.'
+        words = m.clean_string(txt).split()
+        groups = e.get_groups(txt)
+        distinct = set(item[1] for item in groups)
+
+        records = []
+        st = e.enable_stats(records.append)
+        self.assertIs(m.stats, st)
+        self.assertEqual(e.extract(txt), 'Deutsche Bank AG International')
+        self.assertEqual(e.extract(txt), 'Deutsche Bank AG International')
+
+        counts = st.counts
+        self.assertEqual((counts['documents'], counts['characters'], counts['words']), (2, 2 * len(txt), 2 * len(words)))
+        # (flags: issuer and guarantor in each text)
+        self.assertEqual((counts['flags'], counts['groups'], counts['synonym_windows']), (4, 2 * len(groups), 2))
+        self.assertEqual((counts['cache_misses'], counts['cache_hits']), (len(distinct), len(distinct)))
+        self.assertGreater(counts['subsets'], 0)
+        self.assertGreater(counts['candidates'], 0)
+        self.assertEqual(st.peaks['largest_group'], max(len(item[1]) for item in groups))
+        for name in ['clean', 'globalre', 'flags', 'parse', 'synonyms', 'cache', 'score', 'select']:
+            self.assertIn(name, st.times)
+
+        self.assertEqual([r['kind'] for r in records], ['document', 'select'] * 2)
+        self.assertEqual(records[0]['counts']['words'], len(words))
+        self.assertEqual((records[3]['counts']['cache_hits'], records[3]['counts']['cache_misses']), (len(distinct), 0))
+        self.assertEqual(st.summary()['counts'], dict(counts))
+
+        e.disable_stats()
+        self.assertIsNone(m.stats)
+        e.extract(txt)
+        self.assertEqual(st.counts['documents'], 2)
+
+
+class baseline_pickle(unittest.TestCase):
+    '''
+    from_file still loads an extractor pickled by the first version (tests/data/baseline_extractor.pkl).
+    '''
+
+    def test_load(self):
+        e = NEModel.extractor.from_file(os.path.join(os.path.dirname(__file__), 'data', 'baseline_extractor.pkl'))
+        # values extracted by the first version
+        self.assertEqual(e.extract('The Issuer: Deutsche Bank AG, guarantor Barclays'), 'Deutsche Bank AG')
+        self.assertEqual(e.extract('Issuer: Santander int'), 'Banco Santander SA')
+
+        folder = tempfile.mkdtemp()
+        try:
+            e.save(os.path.join(folder, 'model'))
+            e = NEModel.extractor.from_file(os.path.join(folder, 'model'))
+            self.assertEqual(e.extract('Issuer: Santander int'), 'Banco Santander SA')
+        finally:
+            shutil.rmtree(folder)
+
+
+
+class multi(unittest.TestCase):
+    '''
+    multiextractor gives the values of the extractors of its fields, with their stats.
+    '''
+
+    def setUp(self):
+        m = NEModel.matcher(['Barclays Bank PLC', 'Deutsche Bank AG', 'Banco Santander SA'], [('int', 'international')])
+        self.fields = [('guarantor', NEModel.extractor(m, ['guarantee'], ['guarantor'], ['issuer'], start='+')),
+                       ('issuer', NEModel.extractor(m, ['issue'], ['issuer'], ['guarantor'], start='+'))]
+        self.texts = ['Issuer: Deutsche Bank AG, Guarantor: Barclays Bank PLC',
+                      'Notes issued by Banco Santander SA int guaranteed by Barclays',
+                      'nothing here', '']
+
+    def test_values(self):
+        me = NEModel.multiextractor(self.fields)
+        for scores in (False, True):
+            expected = [dict((name, e.extract_batch([txt], scores)[0]) for name, e in self.fields)
+                        for txt in self.texts]
+            self.assertEqual(me.extract_batch(self.texts, scores), expected)
+        self.assertEqual(me.extract(self.texts[0]), {'issuer': 'Deutsche Bank AG', 'guarantor': 'Barclays Bank PLC'})
+
+    def test_stats(self):
+        counts = []
+        for name, e in self.fields:
+            st = e.enable_stats()
+            for txt in self.texts:
+                e.get_groups(txt)
+            counts.append(dict(st.counts))
+        me = NEModel.multiextractor(self.fields)
+        records = []
+        for name, e in self.fields:
+            e.enable_stats(records.append)
+        for txt in self.texts:
+            me.get_groups(txt)
+        self.assertEqual([dict(e.stats.counts) for name, e in self.fields], counts)
+        self.assertEqual(len([r for r in records if r['kind'] == 'document']), 2 * len(self.texts))
+        self.assertIn('clean', self.fields[0][1].stats.times)
+
+    def test_clean_cache(self):
+        NEModel._cleanCache.clear()
+        NEModel.multiextractor(self.fields).get_groups(self.texts[0])
+        self.assertIsNotNone(NEModel._cleanCache.get((str, self.texts[0])))
+
+
+if __name__ == '__main__':
+    unittest.main()
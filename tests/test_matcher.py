@@ -0,0 +1,354 @@
+#
+# Tests of NEModel.matcher:
+#
+#   python -m unittest discover tests
+#
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import NEModel
+
+
+class repeated_words(unittest.TestCase):
+    '''
+    The exact scoring of top_k/closerMatch agree with get_Ps for the names with repeated words.
+    '''
+
+    def setUp(self):
+        self.m = NEModel.matcher(['x y x y x z', 'a b a b', 'Barclays Bank PLC', 'Bank of Bank Bank'], [])
+
+    def test_closer_match(self):
+        for words in ['x y x y', 'x y x z', 'a b a b', 'bank bank', 'barclays bank bank']:
+            ps = self.m.get_Ps(words)
+            best = max(ps)
+            self.assertEqual(self.m.closerMatch(words), (best, self.m.values[ps.index(best)]))
+
+    def test_top_k(self):
+        for words in ['x y x y', 'a b a b b', 'bank bank']:
+            ps = self.m.get_Ps(words)
+            expected = sorted([(-p, x) for x, p in enumerate(ps) if p > 0.0])[:2]
+            self.assertEqual(self.m.top_k(words, 2), [(-p, self.m.values[x]) for p, x in expected])
+
+    def test_baseline_value(self):
+        # probability given by the matcher before the n-gram index
+        self.assertEqual(self.m.closerMatch('x y x y'), (0.1693121693121693, 'x y x y x z'))
+
+
+class top_k(unittest.TestCase):
+    '''
+    top_k and closerMatch, with the upper-bound pruning, give the best names of an exhaustive
+    scoring (get_Ps of each alternative).
+    '''
+
+    def setUp(self):
+        rand = random.Random(1)
+        words = ['alpha', 'beta', 'gamma', 'delta', 'bank', 'plc', 'ag', 'sa', 'holding', 'finance', 'of']
+        names = set()
+        while len(names) < 300:
+            names.add(' '.join(rand.choice(words) for x in xrange(0, rand.randint(1, 6))))
+        self.m = NEModel.matcher(sorted(names), [('intl', 'international'), ('hldg', 'holding')])
+        self.queries = [' '.join(rand.choice(words + ['hldg', 'zz']) for x in xrange(0, rand.randint(1, 6)))
+                        for y in xrange(0, 150)]
+
+    def exhaustive(self, words, k):
+        best = dict()
+        for w in self.m.get_alt(words):
+            for x, p in enumerate(self.m.get_Ps(w)):
+                if p > best.get(x, 0.0):
+                    best[x] = p
+        best = sorted(best.items(), key=lambda item: (-item[1], item[0]))[:k]
+        return [(p, self.m.values[x]) for x, p in best]
+
+    def test_top_k(self):
+        for q in self.queries:
+            for k in (1, 3, 10):
+                expected = self.exhaustive(q, k)
+                for block in (1, 4, 300, None):
+                    self.assertEqual(self.m.top_k(q, k, block), expected, (q, k, block))
+
+    def test_closer_match(self):
+        for q in self.queries:
+            # as the first version: np.argmax of each alternative, then the largest (p, value).
+            expected = []
+            for w in self.m.get_alt(q):
+                ps = self.m.get_Ps(w)
+                expected.append((max(ps), self.m.values[ps.index(max(ps))]))
+            for block in (1, 300, None):
+                self.assertEqual(self.m.closerMatch(q, block), max(expected), (q, block))
+
+
+class match_many(unittest.TestCase):
+    '''
+    match_many gives closerMatch of each name, in order.
+    '''
+
+    def setUp(self):
+        rand = random.Random(2)
+        words = ['alpha', 'beta', 'gamma', 'delta', 'bank', 'plc', 'ag', 'sa', 'holding', 'finance']
+        self.m = NEModel.matcher(sorted(set(' '.join(rand.choice(words) for x in xrange(0, rand.randint(1, 4)))
+                                            for y in xrange(0, 200))), [('hldg', 'holding')])
+        # with repeated names and the same names written differently.
+        self.names = [' '.join(rand.choice(words + ['hldg', 'zz']) for x in xrange(0, rand.randint(1, 4)))
+                      for y in xrange(0, 150)]
+        self.names += [name.upper() + '.' for name in self.names[:30]] + self.names[:30]
+
+    def test_match_many(self):
+        expected = [(name,) + self.m.closerMatch(name) for name in self.names]
+        self.assertEqual(list(self.m.match_many(self.names, workers=1)), expected)
+        self.assertEqual(list(self.m.match_many(iter(self.names), workers=1, chunk=7, cacheSize=10)), expected)
+        self.assertEqual(list(self.m.match_many(self.names, workers=2, chunk=16)), expected)
+        self.assertEqual(list(self.m.match_many([], workers=1)), [])
+
+
+class typos(unittest.TestCase):
+    '''
+    Correction of the unknown words (enable_typos).
+    '''
+
+    def setUp(self):
+        self.m = NEModel.matcher(['Barclays Bank PLC', 'Deutsche Bank AG', 'Societe Generale SA',
+                                  'Commerzbank AG', 'Generali Assicurazioni'], [])
+
+    def test_distance(self):
+        for a, b, d in [('barclays', 'barclays', 0), ('barclys', 'barclays', 1), ('barclayss', 'barclays', 1),
+                        ('barlcays', 'barclays', 1), ('bsrclays', 'barclays', 1), ('bercleys', 'barclays', 2),
+                        ('brclys', 'barclays', 2), ('generale', 'generali', 1), ('bxrcxaxs', 'barclays', 3)]:
+            self.assertEqual(NEModel._distance(a, b, 2), min(d, 3), (a, b))
+
+    def brute(self, word, maxDistance):
+        counts = np.bincount(self.m.tokens, minlength=len(self.m.vocab))
+        best = (maxDistance + 1, 0, -1)
+        for x, w in enumerate(self.m.vocab):
+            if len(w) >= 5 and w.isalpha():
+                best = min(best, (NEModel._distance(word, w, maxDistance), -counts[x], x))
+        return best[2] if best[0] <= maxDistance else None
+
+    def test_correct(self):
+        rand = random.Random(0)
+        letters = 'abcdefghijklmnopqrstuvwxyz'
+        words = [w for w in self.m.vocab if len(w) >= 5]
+        for maxDistance in (1, 2):
+            index = self.m.enable_typos(maxDistance=maxDistance)
+            for x in xrange(0, 2000):
+                w = list(rand.choice(words))
+                for y in xrange(0, rand.randint(1, 3)):
+                    edit = rand.randint(0, 3)
+                    z = rand.randint(0, len(w) - 1)
+                    if edit == 0:
+                        w[z] = rand.choice(letters)
+                    elif edit == 1:
+                        w.insert(z, rand.choice(letters))
+                    elif edit == 2 and len(w) > 5:
+                        del w[z]
+                    elif z + 1 < len(w):
+                        w[z], w[z + 1] = w[z + 1], w[z]
+                w = ''.join(w)
+                self.assertEqual(index.correct(w), self.brute(w, maxDistance), (w, maxDistance))
+        self.assertEqual(index.correct('bercleys'), self.m.Lookup['barclays'])
+        self.assertIsNone(self.m.enable_typos(maxDistance=1).correct('bercleys'))
+        self.assertIsNone(index.correct('bnk')) # shorter than minLength
+
+    def test_match(self):
+        exact = self.m.closerMatch('Barclays Bank')
+        self.assertEqual(self.m.closerMatch('Barclys Bnak')[0], 0.0)
+        self.m.enable_typos()
+        p, value = self.m.closerMatch('Barclys Bnak')
+        self.assertEqual(value, 'Barclays Bank PLC')
+        self.assertLess(p, exact[0])
+        self.assertEqual(self.m.closerMatch('Deutshe Bank')[1], 'Deutsche Bank AG')
+        e = NEModel.extractor(self.m, ['issue'], ['issuer'], ['guarantor'], start='+')
+        self.assertEqual(e.extract('Issuer: Societe Generalle SA zz'), 'Societe Generale SA')
+        self.m.disable_typos()
+        self.assertEqual(self.m.closerMatch('Barclys Bnak')[0], 0.0)
+
+
+class incremental(unittest.TestCase):
+    '''
+    add_values, remove_values and compact give the probabilities of a matcher built from scratch.
+    '''
+
+    def setUp(self):
+        rand = random.Random(0)
+        words = ['alpha', 'beta', 'gamma', 'delta', 'bank', 'plc', 'ag', 'sa', 'holding', 'finance']
+        names = set()
+        while len(names) < 120:
+            names.add(' '.join(rand.choice(words) for x in xrange(0, rand.randint(1, 5))))
+        self.names = sorted(names)
+        self.queries = [' '.join(rand.choice(words + ['zz']) for x in xrange(0, rand.randint(1, 5)))
+                        for y in xrange(0, 100)]
+        self.removed = rand.sample(self.names, 40)
+
+    def check(self, m, names):
+        ref = NEModel.matcher(names, [])
+        live = [x for x in xrange(0, len(m.values)) if not m.removed[x]]
+        self.assertEqual([m.values[x] for x in live], names)
+        for q in self.queries:
+            ps = m.get_Ps(q)
+            self.assertEqual([ps[x] for x in live], ref.get_Ps(q), q)
+            self.assertEqual(m.closerMatch(q), ref.closerMatch(q), q)
+            self.assertEqual(m.top_k(q, 3), ref.top_k(q, 3), q)
+
+    def test_add(self):
+        m = NEModel.matcher(self.names[:50], [])
+        m.add_values(self.names[50:90])
+        m.add_values(self.names[90:])
+        ref = NEModel.matcher(self.names, [])
+        for name in ['keys', 'indptr', 'indices', 'weights', 'l', 'sumkVal', 'tokens', 'offsets']:
+            self.assertTrue(np.array_equal(getattr(m, name), getattr(ref, name)), name)
+        self.check(m, self.names)
+
+    def test_remove_compact(self):
+        m = NEModel.matcher(self.names[:80], [])
+        m.add_values(self.names[80:])
+        m.remove_values(self.removed, compaction=1.0)
+        kept = [name for name in self.names if name not in self.removed]
+        self.check(m, kept)
+        m.compact()
+        self.assertFalse(m.removed.any())
+        self.check(m, kept)
+        # added again after the compaction.
+        m.add_values(self.removed[:10])
+        self.check(m, kept + self.removed[:10])
+        # restored before the compaction.
+        m = NEModel.matcher(self.names, [])
+        m.remove_values(self.removed, compaction=1.0)
+        m.add_values(self.removed[:10])
+        self.check(m, [name for name in self.names if name not in self.removed[10:]])
+
+
+class memory_usage(unittest.TestCase):
+    '''
+    memory_usage counts each structure once, also when the matcher is packed or loaded (mapped).
+    '''
+
+    def setUp(self):
+        self.m = NEModel.matcher(['Barclays Bank PLC', 'Deutsche Bank AG', 'Banco Santander SA'],
+                                 [('intl', 'international')])
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def check(self, usage, names):
+        self.assertEqual(usage.keys(), names + ['total', 'mapped'])
+        self.assertEqual(usage['total'], sum(usage[name] for name in names))
+        self.assertTrue(all(usage[name] > 0 for name in names if name not in ('distinct', 'removed')))
+
+    def test_keys(self):
+        arrays = list(NEModel.matcher._arrays)
+        usage = self.m.memory_usage()
+        self.check(usage, arrays + ['vocab', 'values', 'Lookup', 'synonymes'])
+        self.assertEqual(usage['mapped'], 0)
+        # the codes of the n-grams, built by the first match.
+        self.m.closerMatch('deutsche bank')
+        self.check(self.m.memory_usage(), arrays + ['codes', 'vocab', 'values', 'Lookup', 'synonymes'])
+        self.m.enable_typos()
+        self.m.pack()
+        usage = self.m.memory_usage()
+        self.check(usage, arrays + ['codes', 'vocab', 'vocab_offsets', 'values', 'values_offsets', 'Lookup',
+                                    'synonymes', 'typos'])
+        self.assertEqual(usage['mapped'], 0)
+
+    def test_mapped(self):
+        filename = os.path.join(self.folder, 'matcher')
+        self.m.save(filename)
+        m = NEModel.matcher.from_file(filename)
+        usage = m.memory_usage()
+        names = list(NEModel.matcher._arrays) + ['vocab', 'vocab_offsets', 'values', 'values_offsets', 'synonymes']
+        self.check(usage, names)
+        self.assertEqual(usage['mapped'], sum(usage[name] for name in names if name != 'synonymes'))
+        self.assertEqual(m.closerMatch('deutsche bank')[1], 'Deutsche Bank AG')
+
+
+class sharded(unittest.TestCase):
+    '''
+    shardedmatcher gives the results of the matcher, in this process (workers=1).
+    '''
+    workers = 1
+
+    def setUp(self):
+        rand = random.Random(3)
+        words = ['alpha', 'beta', 'gamma', 'delta', 'bank', 'plc', 'ag', 'sa', 'holding', 'finance', 'of']
+        names = set()
+        while len(names) < 200:
+            names.add(' '.join(rand.choice(words) for x in xrange(0, rand.randint(1, 5))))
+        self.m = NEModel.matcher(sorted(names), [('hldg', 'holding')])
+        self.s = NEModel.shardedmatcher(self.m, shards=3, workers=self.workers)
+        self.queries = [' '.join(rand.choice(words + ['hldg', 'zz']) for x in xrange(0, rand.randint(1, 5)))
+                        for y in xrange(0, 100)]
+        # nothing match: the lowest index is kept in case of equality, also across the shards.
+        self.queries.append('zz')
+
+    def tearDown(self):
+        self.s.close()
+
+    def test_scores(self):
+        self.assertEqual(len(self.s.shards), 3)
+        self.assertEqual((self.s.starts[0], self.s.starts[-1]), (0, len(self.m.l)))
+        for q in self.queries:
+            self.assertEqual(self.s.get_Ps(q), self.m.get_Ps(q), q)
+            for k in (1, 3, 10):
+                self.assertEqual(self.s.top_k(q, k), self.m.top_k(q, k), (q, k))
+            self.assertEqual(self.s.closerMatch(q), self.m.closerMatch(q), q)
+        toTests, ls = zip(*[self.m.to_numberset(q) for q in self.queries])
+        for a, b in zip(self.s.best_Ps_vect(toTests, ls), self.m.best_Ps_vect(toTests, ls)):
+            self.assertTrue(np.array_equal(a, b))
+
+    def test_match_many(self):
+        expected = [(q,) + self.m.closerMatch(q) for q in self.queries]
+        self.assertEqual(list(self.s.match_many(self.queries + self.queries[:10], chunk=16)),
+                         expected + expected[:10])
+
+    def test_changes(self):
+        # the shards are cut again when the matcher changes.
+        self.m.add_values(['Gamma Zz Holding'])
+        self.m.remove_values([self.m.values[0]])
+        for q in ['gamma zz', 'hldg zz', self.m.values[0]]:
+            self.assertEqual(self.s.closerMatch(q), self.m.closerMatch(q), q)
+            self.assertEqual(self.s.top_k(q, 5), self.m.top_k(q, 5), q)
+        self.assertEqual(self.s.starts[-1], len(self.m.l))
+
+    def test_extractor(self):
+        e = NEModel.extractor(self.s, ['issue'], ['issuer'], ['guarantor'], start='+')
+        ref = NEModel.extractor(self.m, ['issue'], ['issuer'], ['guarantor'], start='+')
+        txts = ['Issuer: %s (the guarantor: %s)' % (q, r) for q, r in zip(self.queries, self.queries[::-1])]
+        self.assertEqual(e.extract_batch(txts, scores=True), ref.extract_batch(txts, scores=True))
+
+    def test_memory_usage(self):
+        usage = self.s.memory_usage()
+        self.assertEqual(usage.keys(), ['matcher', 'shard0', 'shard1', 'shard2', 'total'])
+        self.assertEqual(usage['total'], sum(usage[name] for name in usage if name != 'total'))
+        self.assertEqual(usage['matcher'], self.m.memory_usage()['total'])
+        self.assertTrue(all(usage[name] > 0 for name in usage))
+
+
+class sharded_workers(sharded):
+    '''
+    Same with the shards scored in a pool of processes.
+    '''
+    workers = 2
+
+
+class baseline_pickle(unittest.TestCase):
+    '''
+    from_file still loads a matcher pickled by the first version (tests/data/baseline_matcher.pkl).
+    '''
+
+    def test_load(self):
+        m = NEModel.matcher.from_file(os.path.join(os.path.dirname(__file__), 'data', 'baseline_matcher.pkl'))
+        self.assertEqual(list(m.values), ['Barclays Bank PLC', 'Deutsche Bank AG', 'Banco Santander SA'])
+        self.assertEqual(m.closerMatch('deutsche bank')[1], 'Deutsche Bank AG')
+        self.assertEqual(m.closerMatch('santander london branch')[1], 'Banco Santander SA')
+        m.add_values(['Societe Generale SA'])
+        self.assertEqual(m.top_k('societe generale', 1)[0][1], 'Societe Generale SA')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+#
+# Tests of NEServer:
+#
+#   python -m unittest discover tests
+#
+import json
+import os
+import sys
+import threading
+import time
+import unittest
+import urllib2
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import NEModel
+import NEServer
+
+
+class failing(NEModel.extractor):
+    '''
+    Extractor failing on the texts containing 'boom' (exception), 'exit' (the process ends),
+    'slow' (no answer for 5 s) or 'lambda' (result which can not be pickled).
+    '''
+
+    def extract_batch(self, txts, scores=False):
+        if any('boom' in txt for txt in txts):
+            raise ValueError('boom')
+        if any('exit' in txt for txt in txts):
+            os._exit(1)
+        if any('slow' in txt for txt in txts):
+            time.sleep(5)
+        if any('lambda' in txt for txt in txts):
+            return [lambda: txt for txt in txts]
+        return NEModel.extractor.extract_batch(self, txts, scores)
+
+
+class errors(unittest.TestCase):
+    '''
+    A failing request gets an error and the next ones are still served.
+    '''
+    workers = 1
+
+    def setUp(self):
+        m = NEModel.matcher(['Barclays Bank PLC', 'Deutsche Bank AG'], [])
+        e = failing(m, ['issue'], ['issuer'], ['guarantor'], start='+')
+        self.server = NEServer.server(e, port=0, workers=self.workers, maxWait=0.0, timeout=1.0)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/extract' % self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def post(self, data):
+        return json.load(urllib2.urlopen(self.url, json.dumps(data), timeout=10))
+
+    def test_in_process(self):
+        self.assertEqual(self.post({'text': 'boom'})['error'], 'ValueError: boom')
+        self.assertEqual(self.post({'text': 'Issuer: Deutsche Bank AG'})['result'], 'Deutsche Bank AG')
+        results = self.post({'texts': ['Issuer: Barclays Bank PLC', 'boom']})['results']
+        self.assertEqual(results[1]['error'], 'ValueError: boom')
+        self.assertEqual(self.post({'text': 'Issuer: Barclays Bank PLC'})['result'], 'Barclays Bank PLC')
+
+
+class worker_errors(errors):
+    '''
+    Same with worker processes, which can also die, not answer or give a result which can not be
+    sent back.
+    '''
+    workers = 2
+
+    def test_workers(self):
+        self.assertEqual(self.post({'text': 'boom'})['error'], 'ValueError: boom')
+        self.assertTrue(self.post({'text': 'exit'})['error'].startswith('timeout'))
+        self.assertTrue(self.post({'text': 'slow'})['error'].startswith('timeout'))
+        self.assertIn('MaybeEncodingError', self.post({'text': 'lambda'})['error'])
+        self.assertEqual(self.post({'text': 'Issuer: Deutsche Bank AG'})['result'], 'Deutsche Bank AG')
+        self.assertEqual(self.server.batcher.errors, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
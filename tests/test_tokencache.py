@@ -0,0 +1,73 @@
+#
+# Tests of NEModel.tokencache:
+#
+#   python -m unittest discover tests
+#
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import NEModel
+
+
+class tokencache(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.m = NEModel.matcher(['Barclays Bank PLC', 'Deutsche Bank AG'], [])
+        self.e = NEModel.extractor(self.m, ['issue'], ['issuer'], ['guarantor'], start='+')
+        self.cache = NEModel.tokencache(os.path.join(self.folder, 'cache'), self.m)
+        self.txt = 'The Issuer: Deutsche Bank AG, London Branch (the "Bank").'
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_hit(self):
+        words = self.m.clean_string(self.txt).split()
+        self.assertEqual(self.cache.words(self.txt), words)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+        self.assertEqual(self.cache.words(self.txt), words)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        # an other cache on the same folder (an other run or process).
+        cache = NEModel.tokencache(os.path.join(self.folder, 'cache'), self.m)
+        self.assertEqual(cache.words(self.txt), words)
+        self.assertEqual((cache.hits, cache.misses), (1, 0))
+        self.assertEqual(self.e.extract(cache.words(self.txt)), self.e.extract(self.txt))
+
+    def test_read(self):
+        path = os.path.join(self.folder, 'doc.txt')
+        with open(path, 'wb') as f:
+            f.write(self.txt)
+        words = self.m.clean_string(self.txt).split()
+        self.assertEqual(self.cache.read(path), words)
+        self.assertEqual(self.cache.read(path), words)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_vocabulary(self):
+        # a new word in the vocabulary: the entries of the old vocabulary are not used.
+        self.cache.words(self.txt)
+        self.m.add_values(['Deutsche Bank AG London Branch'])
+        words = self.m.clean_string(self.txt).split()
+        self.assertEqual(self.cache.words(self.txt), words)
+        self.assertEqual((self.cache.hits, self.cache.misses), (0, 2))
+        self.assertEqual(self.cache.words(self.txt), words)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.e.extract(self.cache.words(self.txt)), 'Deutsche Bank AG London Branch')
+
+    def test_eviction(self):
+        self.cache.words(self.txt)
+        size = self.cache.size
+        self.cache.maxSize = int(size * 2.5)
+        for x in xrange(0, 5):
+            self.cache.words('%s %d' % (self.txt, x))
+        self.assertLessEqual(self.cache.size, self.cache.maxSize)
+        self.assertEqual(self.cache.size, sum(size for path, size, used in self.cache._entries()))
+        self.cache.clear()
+        self.assertEqual((self.cache.size, self.cache._entries()), (0, []))
+
+
+if __name__ == '__main__':
+    unittest.main()
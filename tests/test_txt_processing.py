@@ -0,0 +1,113 @@
+#
+# Tests of Issuer_extraction/txt_processing:
+#
+#   python -m unittest discover tests
+#
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import unittest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, 'Issuer_extraction'))
+import html2text
+import NEModel
+import txt_processing
+
+HTML = '''<html><head><title>Final Terms</title><style>p {color: red}</style>
+<script>var issuer = "Deutsche Bank AG";</script></head>
+<body><h1>FINAL TERMS</h1>
+<p>Dated 12 May 2015 &amp; amended. Notes issued by <b>Barclays Bank PLC</b> acting through its
+London branch...</p>
+<table><tr><td>1.</td><td>Issuer:</td><td>Soci&eacute;t&eacute; G&#233;n&#xe9;rale SA</td></tr>
+<tr><td>2.</td><td>Guarantor:</td><td>Deutsche&nbsp;Bank AG</td></tr></table>
+<p>Series -- Tranche : 5 &ndash; 6 &rsquo;s</p><ul><li>one</li><li>two</li></ul>
+</body></html>'''
+
+
+def clean_text(text):
+    '''
+    clean_text before the single pass version.
+    '''
+    text = text.replace('*', '')
+    text = text.replace('#', '')
+    text = text.replace('\t', ' ')
+    text = text.replace('\r', ' ')
+    text = text.replace('&',' and ')
+    text = re.sub(r'\.[\.\s]+', r'.\n\n', text)
+    text = re.sub(r'(\n)*(\s)*\|+(\s)*(\n)*', r'', text)
+    text = re.sub(r'--+', r'', text)
+    text = re.sub(r'[\s\.]*:[\s\.]*', r': ', text)
+    text = text.replace('\n', ' ')
+    return text
+
+
+class clean(unittest.TestCase):
+
+    def test_clean_text(self):
+        rand = random.Random(0)
+        texts = ['a . b', 'a...  b', 'x | y', 'a:b', 'a -- b - c', '1.\n\n| Issuer : | Barclays\n---|---',
+                 'Issuer:\r\n\tBarclays & co *note* #1']
+        texts += [''.join(rand.choice('ab .|:-\n\t\r*#&\x0b\x0c') for x in xrange(0, 30)) for y in xrange(0, 2000)]
+        for text in texts:
+            self.assertEqual(txt_processing.clean_text(text), clean_text(text))
+
+
+class html(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.filename = os.path.join(self.folder, 'page.html')
+        with open(self.filename, 'w') as f:
+            f.write(HTML)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def test_default(self):
+        # html2text by default, as before the fast path.
+        self.assertEqual(txt_processing.get_text(self.filename, raw=False), html2text.html2text(txt_processing.pre_html(HTML)))
+
+    def test_fast(self):
+        # the fast path gives the words of html2text followed by clean_text.
+        words = NEModel.matcher(['x'], []).clean_string
+        fast = txt_processing.get_text(self.filename, raw=False, fast=True)
+        slow = clean_text(txt_processing.get_text(self.filename, raw=False))
+        self.assertEqual(words(fast).split(), words(slow).split())
+        self.assertIn('societe generale sa', words(fast))
+
+
+
+class files(unittest.TestCase):
+
+    def setUp(self):
+        self.parent = tempfile.mkdtemp()
+        self.folder = os.path.join(self.parent, 'txt')
+        os.mkdir(self.folder)
+        for name in ['123_a.txt', '456_b.txt']:
+            open(os.path.join(self.folder, name), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.parent)
+
+    def test_no_index(self):
+        files = txt_processing.get_files(self.folder)
+        self.assertEqual(sorted(files), ['123', '456'])
+        self.assertEqual(os.listdir(self.parent), ['txt'])
+
+    def test_index(self):
+        files = txt_processing.get_files(self.folder, index=True)
+        self.assertEqual(sorted(os.listdir(self.parent)), ['txt', 'txt.index'])
+        self.assertEqual(txt_processing.get_files(self.folder, index=True), files)
+        # a new file changes the modification time of the folder.
+        open(os.path.join(self.folder, '789_c.txt'), 'w').close()
+        os.utime(self.folder, (0, 0))
+        self.assertEqual(sorted(txt_processing.get_files(self.folder, index=True)), ['123', '456', '789'])
+
+
+if __name__ == '__main__':
+    unittest.main()